@@ -1,22 +1,38 @@
 import aiohttp
 import asyncio
+import os
+import time
 import pandas as pd
-from datetime import datetime
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+API_BASE_URL = os.environ.get('DEVICE_API_URL', 'https://api.example.com').rstrip('/')  # e.g. a local fake_device_api.py
+DETAILS_CSV = 'device_details.csv'
+DETAIL_HISTORY_SIZE = 0  # Past details kept in memory per device, 0 keeps only the latest
+
+# Detail fetch concurrency: starts at INITIAL, halves on 429/5xx (at most once per window), grows by one per window of successes
+MIN_CONCURRENCY = 1
+INITIAL_CONCURRENCY = 10
+MAX_CONCURRENCY = 50
+CONNECTION_LIMIT = 100  # Open connections across all hosts
+CONNECTIONS_PER_HOST = 50  # Open connections to any single API host
 
 # Global variables to hold the latest device list and details
 device_list = []
-device_details_all = []
+latest_device_details = {}  # device_id -> most recent detail
+device_detail_history = {}  # device_id -> deque of the last DETAIL_HISTORY_SIZE details
 
 # Step 1: Function to fetch the list of devices
 async def get_device_list(session, condition, headers):
-    url = f"https://api.example.com/get_device_list?condition={condition}"
+    url = f"{API_BASE_URL}/get_device_list?condition={condition}"
     async with session.get(url, headers=headers) as response:
         response.raise_for_status()  # Ensure we catch HTTP errors
         return await response.json()
 
 # Step 2: Function to fetch details for a specific device
 async def get_device_details(session, device_id, headers):
-    url = f"https://api.example.com/get_device_details?device_id={device_id}"
+    url = f"{API_BASE_URL}/get_device_details?device_id={device_id}"
     async with session.get(url, headers=headers) as response:
         response.raise_for_status()
         return await response.json()
@@ -35,38 +51,184 @@ async def update_device_list(session, condition, headers):
         print(f"Device list updated with {len(device_list['devices'])} devices")
         await asyncio.sleep(24 * 60 * 60)  # Sleep for 24 hours
 
+def record_device_detail(device_id, detail):
+    """Stores a device's newest detail and returns True if it differs from the previous one."""
+    if DETAIL_HISTORY_SIZE:
+        device_detail_history.setdefault(device_id, deque(maxlen=DETAIL_HISTORY_SIZE)).append(detail)
+    changed = latest_device_details.get(device_id) != detail
+    latest_device_details[device_id] = detail
+    return changed
+
+def forget_removed_devices(device_ids):
+    """Drops the details of devices that are no longer in the device list."""
+    for device_id in set(latest_device_details) - set(device_ids):
+        del latest_device_details[device_id]
+        device_detail_history.pop(device_id, None)
+
+def append_changed_details(rows, path=DETAILS_CSV):
+    """Appends only the rows that changed this cycle.
+
+    Rows are appended under the file's existing header. When they bring new
+    columns (e.g. a field the API started sending), the file is rewritten
+    once with the widened header instead of dropping those values.
+    """
+    if not rows:
+        return
+    df = pd.DataFrame(rows)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        df.to_csv(path, index=False)
+        return
+
+    columns = pd.read_csv(path, nrows=0).columns
+    new_columns = [column for column in df.columns if column not in columns]
+    if not new_columns:
+        df.reindex(columns=columns).to_csv(path, mode='a', header=False, index=False)
+        return
+
+    # Read the existing rows as text so they are rewritten exactly as they were
+    existing = pd.read_csv(path, dtype=str, keep_default_na=False)
+    combined = pd.concat([existing, df], ignore_index=True)
+    combined = combined.reindex(columns=list(columns) + new_columns)
+    temp_path = f"{path}.tmp"
+    combined.to_csv(temp_path, index=False)
+    os.replace(temp_path, path)
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight requests.
+
+    Each success raises the limit by 1/limit, so it grows by about one per
+    full window of requests. A throttled response (429 or 5xx) halves it,
+    but only once per window: throttles from requests that were already in
+    flight when the limit was last cut are ignored, since they report the
+    old limit. A Retry-After on a throttled response pauses new requests
+    until it has passed. The limit stays between minimum and maximum.
+    """
+
+    def __init__(self, minimum=MIN_CONCURRENCY, initial=INITIAL_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(initial)
+        self.active = 0
+        self.last_decrease = float('-inf')
+        self.resume_at = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        """Waits for a free slot and returns the request's start time, to be passed to release()."""
+        while (pause := self.resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(pause)
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+        return time.monotonic()
+
+    async def release(self, started, throttled=False, retry_after=None):
+        async with self.condition:
+            self.active -= 1
+            now = time.monotonic()
+            if throttled:
+                if started >= self.last_decrease:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.last_decrease = now
+                if retry_after:
+                    self.resume_at = max(self.resume_at, now + retry_after)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+def is_throttled(error):
+    """True for responses telling us to slow down: 429 Too Many Requests and 5xx."""
+    return isinstance(error, aiohttp.ClientResponseError) and (error.status == 429 or error.status >= 500)
+
+def retry_after_seconds(error):
+    """Returns the Retry-After of a failed response in seconds (given as seconds or an HTTP date), or None."""
+    value = (getattr(error, 'headers', None) or {}).get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+async def fetch_all_device_details(session, devices, headers, concurrency):
+    """Fetches every device's details through a pool of MAX_CONCURRENCY workers gated by concurrency.
+
+    Returns the results in device order, with an exception in place of each
+    failed fetch, and prints the run's throughput and error rate.
+    """
+    results = [None] * len(devices)
+    queue = asyncio.Queue()
+    for index in range(len(devices)):
+        queue.put_nowait(index)
+    throttled_count = 0
+
+    async def worker():
+        nonlocal throttled_count
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = await concurrency.acquire()
+            throttled = False
+            retry_after = None
+            try:
+                results[index] = await get_device_details(session, devices[index]['id'], headers)
+            except Exception as e:
+                results[index] = e
+                throttled = is_throttled(e)
+                throttled_count += throttled
+                retry_after = retry_after_seconds(e) if throttled else None
+            finally:
+                await concurrency.release(started, throttled, retry_after)
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(min(MAX_CONCURRENCY, len(devices)))))
+    elapsed = time.monotonic() - started
+
+    errors = sum(isinstance(result, Exception) for result in results)
+    print(f"Fetched {len(devices)} device details in {elapsed:.1f}s "
+          f"({len(devices) / elapsed if elapsed else 0:.1f}/s), "
+          f"{errors} errors ({errors / len(devices):.1%}), {throttled_count} throttled, "
+          f"concurrency now {int(concurrency.limit)}")
+    return results
+
 # Step 4: Task to fetch device details every 20 minutes
 async def update_device_details(session, headers):
-    global device_list, device_details_all
+    global device_list
+    concurrency = AdaptiveConcurrency()  # Kept across cycles so the learned limit carries over
     while True:
-        if device_list:
+        if device_list and device_list['devices']:
             print("Fetching device details...")
-            tasks = []
-            for device in device_list['devices']:
-                device_id = device['id']
-                task = asyncio.ensure_future(get_device_details(session, device_id, headers))
-                tasks.append(task)
-            
-            device_details = await asyncio.gather(*tasks, return_exceptions=True)
+            device_details = await fetch_all_device_details(session, device_list['devices'], headers, concurrency)
             
             # Handle the results
+            changed_rows = []
+            fetched_at = str(datetime.now())
             for i, detail in enumerate(device_details):
                 if isinstance(detail, Exception):
                     print(f"Error fetching details for device {device_list['devices'][i]['id']}: {detail}")
                 else:
                     detail['device_id'] = device_list['devices'][i]['id']
-                    device_details_all.append(detail)
+                    if record_device_detail(detail['device_id'], detail):
+                        changed_rows.append(dict(detail, fetched_at=fetched_at))
                     print(f"Device ID: {device_list['devices'][i]['id']}, Details: {detail}")
+            forget_removed_devices(device['id'] for device in device_list['devices'])
             
-            # Save device details to CSV
-            df_device_details = pd.DataFrame(device_details_all)
-            df_device_details.to_csv('device_details.csv', index=False)
+            # Save the details that changed since the last cycle to CSV
+            append_changed_details(changed_rows)
+            print(f"{len(changed_rows)} of {len(latest_device_details)} device details changed")
         
         await asyncio.sleep(20 * 60)  # Sleep for 20 minutes
 
 # Step 5: Main function to start both tasks
 async def main(condition, headers):
-    async with aiohttp.ClientSession() as session:
+    connector = aiohttp.TCPConnector(limit=CONNECTION_LIMIT, limit_per_host=CONNECTIONS_PER_HOST)
+    async with aiohttp.ClientSession(connector=connector) as session:
         # Start both tasks
         task1 = asyncio.create_task(update_device_list(session, condition, headers))
         task2 = asyncio.create_task(update_device_details(session, headers))
@@ -75,11 +237,12 @@ async def main(condition, headers):
         await asyncio.gather(task1, task2)
 
 # Entry point to run the asynchronous code
-condition = "some_condition"
-headers = {
-    "Authorization": "Bearer YOUR_ACCESS_TOKEN",
-    "Accept": "application/json",
-    "Custom-Header": "CustomValue"
-}
-
-asyncio.run(main(condition, headers))
+if __name__ == "__main__":
+    condition = "some_condition"
+    headers = {
+        "Authorization": "Bearer YOUR_ACCESS_TOKEN",
+        "Accept": "application/json",
+        "Custom-Header": "CustomValue"
+    }
+
+    asyncio.run(main(condition, headers))
@@ -1,183 +1,284 @@
 import asyncio
 import aiohttp
-import csv
-import json
-from datetime import datetime
-
-# Async function to pull total device count
-async def fetch_device_count(session, url):
-    async with session.get(url) as response:
-        data = await response.json()
-        return data['device_count']
-
-# Async function to pull device list in batches
-async def fetch_device_list(session, url, offset):
-    async with session.get(url, params={'offset': offset, 'limit': 500}) as response:
-        return await response.json()
-
-# Async function to pull health data in batches
-async def fetch_device_health(session, url, offset):
-    async with session.get(url, params={'offset': offset, 'limit': 500}) as response:
-        return await response.json()
-
-# Async function to pull detailed info for each device
-async def fetch_device_detail(session, url, device_id):
-    async with session.get(f"{url}/{device_id}") as response:
-        return await response.json()
-
-# Save raw data to CSV
-def save_raw_data_to_csv(device_id, raw_data):
-    with open('raw_data.csv', mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([device_id, raw_data])
-
-# Save processed data to CSV
-def save_processed_data_to_csv(processed_data):
-    with open('processed_data.csv', mode='a', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=processed_data.keys())
-        writer.writerow(processed_data)
-
-# Save device count to file
-def save_device_count_to_file(count):
-    with open('device_count.json', mode='w') as file:
-        json.dump({"device_count": count, "timestamp": str(datetime.now())}, file)
-
-# Load device count from file
-def load_device_count_from_file():
-    try:
-        with open('device_count.json', mode='r') as file:
-            data = json.load(file)
-            return data['device_count']
-    except FileNotFoundError:
-        return 1800  # Default value if no file is found
-
-# Save device list to CSV
-def save_device_list_to_csv(device_list):
-    with open('device_list.csv', mode='w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=['device_id', 'device_name', 'device_type'])  # Adjust fields as needed
-        writer.writeheader()
-        for device in device_list:
-            writer.writerow(device)
-
-# Filter devices where 'reachabilityHealth' is 'DOWN'
-def filter_down_devices(device_data):
-    return [device for device in device_data if device.get('reachabilityHealth') == 'DOWN']
-
-# Task for pulling the total device count and device list every 24 hours
-async def pull_device_count_and_list_every_24hrs(http_session):
-    device_count_url = "http://api.device3.com/get_device_count"
-    device_list_url = "http://api.device3.com/get_device_list"
-    
-    while True:
-        # Step 1: Get the total device count
-        device_count = await fetch_device_count(http_session, device_count_url)
-        save_device_count_to_file(device_count)
-        print(f"Updated device count: {device_count}")
-        
-        # Step 2: Get the full device list in batches
-        full_device_list = []
-        for offset in range(0, device_count, 500):  # Call API in batches of 500 devices
-            device_list = await fetch_device_list(http_session, device_list_url, offset)
-            full_device_list.extend(device_list)  # Collect all devices across batches
-        
-        # Step 3: Save the complete device list to CSV
-        save_device_list_to_csv(full_device_list)
-        print(f"Device list updated, total devices: {len(full_device_list)}")
-
-        await asyncio.sleep(24 * 60 * 60)  # Sleep for 24 hours
-
-# Task for pulling device health and processing data every 15 minutes
-async def pull_every_15min(http_session):
-    while True:
-        # Load the latest device count from the file
-        total_devices = load_device_count_from_file()
-
-        # Step 1: Pull device health data in batches based on total_devices
-        base_url_health = "http://api.device3.com/device_health"
-        down_devices = []
-        for offset in range(0, total_devices, 500):  # Call API in batches of 500 devices
-            raw_health_data = await fetch_device_health(http_session, base_url_health, offset)
-            save_raw_data_to_csv(f"batch_offset_{offset}", raw_health_data)
-            
-            # Step 2: Filter devices with 'reachabilityHealth' = 'DOWN'
-            down_devices += filter_down_devices(raw_health_data)
-
-        # Step 3: Call detail API for filtered devices, limit 100 calls per minute
-        base_url_detail = "http://api.device3.com/device_detail"
-        for i in range(0, len(down_devices), 100):  # Process 100 devices per minute
-            tasks = [
-                fetch_device_detail(http_session, base_url_detail, device['device_id'])
-                for device in down_devices[i:i+100]
-            ]
-            device_details = await asyncio.gather(*tasks)
-
-            # Save processed device details
-            for device in device_details:
-                processed_data = process_data(device)
-                save_processed_data_to_csv(processed_data)
-
-            await asyncio.sleep(60)  # Respect API limit (100 calls/min)
-
-        await asyncio.sleep(15 * 60)  # Sleep for 15 minutes
-
-# Example function to process data (you can customize this as needed)
-def process_data(raw_data):
-    processed = {
-        'device_id': raw_data['device_id'],
-        'status': raw_data['status'],
-        'signal_strength': raw_data['signal_strength'],
-        'timestamp': raw_data['timestamp']
-    }
-    return processed
-
-# Main function to handle async pulling and processing
-async def main():
-    async with aiohttp.ClientSession() as http_session:
-        tasks = [
-            pull_device_count_and_list_every_24hrs(http_session),
-            pull_every_15min(http_session)
-        ]
-        await asyncio.gather(*tasks)
-
-# Run the async loop
-if __name__ == "__main__":
-    # Initialize CSVs with headers
-    with open('raw_data.csv', mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["device_id", "raw_json"])
-
-    with open('processed_data.csv', mode='w', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=["device_id", "status", "signal_strength", "timestamp"])
-        writer.writeheader()
-
-    # Run the async data pulling and processing
-    asyncio.run(main())
-
-
-
-#------------------------------------------------------------
-import asyncio
-import aiohttp
+import atexit
 import pandas as pd
+import contextvars
 import csv
+import heapq
+import itertools
 import json
 import os
-from datetime import datetime
+import queue
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from aiohttp import web
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from history_store import HistoryStore
+from inventory_store import InventoryStore
+from pipeline_metrics import MetricsRegistry
 
 # Global variables
 down_device_tracker = {}  # Tracks devices that are down
-semaphore = asyncio.Semaphore(10)  # Limits concurrent API calls to 10
+MAX_CONCURRENT_REQUESTS = 10  # Concurrent API calls across every job, see PrioritySemaphore
+PAGE_SIZE = 500  # Devices per page for the paginated list and health endpoints
+PAGE_WINDOW = 10  # Pages fetched ahead of the consumer
+DETAIL_WORKERS = 10  # Concurrent detail lookups in the health pipeline
+DETAIL_QUEUE_SIZE = 1000  # Max DOWN devices waiting for a detail lookup (0 = unbounded)
+DETAIL_REFRESH_CYCLES = 8  # Re-fetch details of devices still DOWN after this many cycles (0 = never)
+STATE_FLUSH_CHANGES = 100  # Flush the down tracker after this many unsaved changes
+STATE_FLUSH_SECONDS = 30  # ... or once the oldest unsaved change is this many seconds old
+WRITE_QUEUE_SIZE = 1000  # Pending disk writes before producers are made to wait
+CSV_FLUSH_ROWS = 500  # Buffered CSV rows written in one go
+CSV_FLUSH_SECONDS = 5  # Max age of buffered CSV rows before they are written
+CSV_ROTATE_BYTES = 100 * 1024 * 1024  # Rotate an appended CSV past this size (it also rotates daily)
+HISTORY_DIR = 'history'  # Root of the per-device status/signal history store
+DOWN_DEVICES_DIR = 'down_devices'  # One CSV segment per day: down_devices/YYYY-MM-DD.csv
+DOWN_DEVICES_RETENTION_DAYS = 14  # Down-device segments older than this many days are deleted
+HISTORY_RETENTION_DAYS = 30  # Day partitions of the history store older than this are deleted
+INVENTORY_DB = 'inventory.sqlite'  # Device inventory, updated by diffs on every list sync
+INVENTORY_DELTA_PARAM = None  # Query parameter for fetching only devices updated since a lastUpdated value, if the API has one
+INVENTORY_FULL_SYNC_DAYS = 7  # Delta syncs can't see removed devices, so a full sync still runs this often
+INVENTORY_CHANGE_RETENTION_DAYS = 90  # Logged inventory changes older than this are deleted
+EVENT_SERVER_PORT = 8081  # Port of the local server streaming device state changes and metrics
+METRICS_JSON_PATH = os.environ.get('PIPELINE_METRICS_JSON')  # Append a JSON metrics snapshot here after each job run
+EVENT_REPLAY_SIZE = 1000  # Recent events kept for clients resuming with Last-Event-ID
+EVENT_HEARTBEAT_SECONDS = 15  # Idle time before a keep-alive comment is sent
+
+# Per-endpoint API budgets, keyed by the first path segment of the URL.
+# Endpoints without an entry are only bounded by the semaphore. A '*' entry
+# is a budget shared by every request, e.g. a controller-wide limit:
+#     '*': {'calls_per_minute': 600, 'burst': 20},
+RATE_LIMITS = {
+    'device_detail': {'calls_per_minute': 100, 'burst': 10},
+}
+JOB_MISFIRE_GRACE_SECONDS = 5 * 60  # A run delayed longer than this is skipped (missed runs coalesce into one)
+JOB_BUDGET_WARNING = 0.8  # Warn when a run takes this share of its job's interval
+REQUEST_TIMEOUT_SECONDS = 60  # Total time allowed for one request attempt
+BREAKER_FAILURE_THRESHOLD = 5  # Consecutive failures that open an endpoint's circuit
+BREAKER_RESET_SECONDS = 30  # Time an open circuit fails fast before letting a trial request through
+HTTP_CONNECTION_LIMIT = 100  # Pooled connections shared by every job
+HTTP_CONNECTIONS_PER_HOST = 20  # Pooled connections to any single API host
+HTTP_KEEPALIVE_SECONDS = 60  # Idle time before a pooled connection is closed
+HTTP_DNS_CACHE_SECONDS = 300  # How long resolved API hostnames are reused
+TOKEN_REFRESH_MARGIN_SECONDS = 60  # Refresh the auth token this long before it expires
+API_BASE_URL = os.environ.get('DEVICE_API_URL', 'http://api.device3.com').rstrip('/')  # e.g. a local fake_device_api.py
+USERNAME = os.environ.get('DEVICE_API_USERNAME', '')
+PASSWORD = os.environ.get('DEVICE_API_PASSWORD', '')
+# Requests are only authenticated when an auth URL or credentials are configured
+AUTH_URL = os.environ.get('DEVICE_API_AUTH_URL') or (f'{API_BASE_URL}/auth' if USERNAME or PASSWORD else None)
+
+# -----------------------------
+# Disk Writer
+# -----------------------------
+
+class DiskWriter:
+    """Runs blocking file writes on a single background thread fed by a bounded queue.
+
+    Coroutines hand writes over with submit(), so the event loop never waits
+    on disk. Writes run in submission order. When the queue is full submit()
+    waits for room, which slows the producers instead of growing memory;
+    submits queue up behind a blocked one, so none can overtake it.
+    close() drains the queue and stops the thread.
+
+    Callables in idle_hooks run on the writer thread whenever the queue has
+    been empty for idle_seconds, and once more before the thread stops.
+    """
+
+    def __init__(self, maxsize, idle_seconds):
+        self.queue = queue.Queue(maxsize)
+        self.idle_seconds = idle_seconds
+        self.idle_hooks = []
+        self.thread = None
+        self.submit_lock = asyncio.Lock()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='disk-writer', daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def _run_idle_hooks(self):
+        for hook in self.idle_hooks:
+            try:
+                hook()
+            except Exception as e:
+                print(f"Idle hook {hook.__name__} failed: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_seconds)
+            except queue.Empty:
+                self._run_idle_hooks()
+                continue
+            try:
+                if item is None:
+                    self._run_idle_hooks()
+                    return
+                func, args = item
+                try:
+                    func(*args)
+                except Exception as e:
+                    print(f"Write failed in {func.__name__}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def submit(self, func, *args):
+        """Queues func(*args) for the writer thread, waiting while the queue is full."""
+        self.start()
+        async with self.submit_lock:  # FIFO, so submit order is queue order even while the queue is full
+            try:
+                self.queue.put_nowait((func, args))
+            except queue.Full:
+                await asyncio.to_thread(self.queue.put, (func, args))
+
+    async def drain(self):
+        """Waits until every queued write has run."""
+        await asyncio.to_thread(self.queue.join)
+
+    def close(self):
+        """Flushes the queued writes and stops the writer thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+disk_writer = DiskWriter(WRITE_QUEUE_SIZE, CSV_FLUSH_SECONDS)
+
+class CsvAppender:
+    """Long-lived, buffered appender for a CSV file.
+
+    Keeps the file open and writes buffered rows in one go once flush_rows
+    are pending or the oldest is flush_seconds old. The file is rotated to
+    <name>.<YYYY-MM-DD>[.N].csv when it grows past rotate_bytes or the day
+    changes; each new file starts with the header. Appenders are not thread
+    safe and are only used from the disk writer thread.
+    """
+
+    def __init__(self, path, fieldnames, flush_rows=CSV_FLUSH_ROWS,
+                 flush_seconds=CSV_FLUSH_SECONDS, rotate_bytes=CSV_ROTATE_BYTES):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.rotate_bytes = rotate_bytes
+        self.rows = []
+        self.first_row_time = None
+        self.file = None
+        self.writer = None
+        self.day = None
+
+    def _open(self):
+        self.file = open(self.path, mode='a', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+        self.day = datetime.now().date()
+
+    def _rotate_if_needed(self):
+        if self.file is None:
+            return
+        if self.day == datetime.now().date() and self.file.tell() < self.rotate_bytes:
+            return
+        self.file.close()
+        self.file = None
+        stem, ext = os.path.splitext(self.path)
+        rotated = f"{stem}.{self.day.isoformat()}{ext}"
+        n = 1
+        while os.path.exists(rotated):
+            rotated = f"{stem}.{self.day.isoformat()}.{n}{ext}"
+            n += 1
+        os.replace(self.path, rotated)
+
+    def append(self, row):
+        """Buffers one row (a dict keyed by fieldnames), writing the buffer if a threshold is reached."""
+        self.rows.append(row)
+        if self.first_row_time is None:
+            self.first_row_time = time.monotonic()
+        if len(self.rows) >= self.flush_rows or time.monotonic() - self.first_row_time >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows to disk."""
+        if not self.rows:
+            return
+        self._rotate_if_needed()
+        if self.file is None:
+            self._open()
+        self.writer.writerows(self.rows)
+        self.file.flush()
+        self.rows = []
+        self.first_row_time = None
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+processed_data_appender = CsvAppender('processed_data.csv', ["device_id", "status", "signal_strength", "timestamp"])
+disk_writer.idle_hooks.append(processed_data_appender.flush)
+
+history_store = HistoryStore(HISTORY_DIR)
+inventory_store = InventoryStore(INVENTORY_DB, INVENTORY_CHANGE_RETENTION_DAYS)  # Written only on the disk writer thread
+
+# -----------------------------
+# Metrics
+# -----------------------------
+
+metrics = MetricsRegistry(prefix='wifi_')
+api_request_seconds = metrics.histogram('api_request_seconds', "API request latency by endpoint")
+api_requests_total = metrics.counter('api_requests_total', "API request attempts by endpoint and result")
+api_retries_total = metrics.counter('api_retries_total', "API request retries by endpoint")
+api_failures_total = metrics.counter('api_failures_total', "API requests given up on by endpoint")
+circuit_rejections_total = metrics.counter('circuit_rejections_total', "Requests refused by an open circuit by endpoint")
+rate_limit_wait_seconds = metrics.histogram('rate_limit_wait_seconds', "Time spent waiting for a rate-limit token by endpoint")
+semaphore_wait_seconds = metrics.histogram('semaphore_wait_seconds', "Time spent waiting for a concurrent request slot")
+job_duration_seconds = metrics.histogram('job_duration_seconds', "Scheduled job run time by job",
+                                         buckets=(1, 5, 10, 30, 60, 120, 300, 600, 900, 1800, 3600))
+job_last_duration_seconds = metrics.gauge('job_last_duration_seconds', "Run time of the latest run by job")
+job_overruns_total = metrics.counter('job_overruns_total', "Job runs that took longer than the job's interval by job")
+job_skipped_runs_total = metrics.counter('job_skipped_runs_total', "Job runs skipped as missed or still running by job")
+devices_down = metrics.gauge('devices_down', "Devices currently tracked as down", func=lambda: len(down_device_tracker))
+write_queue_depth = metrics.gauge('write_queue_depth', "Disk writes waiting for the writer thread",
+                                  func=lambda: disk_writer.queue.qsize())
+
+def append_metrics_json(path, record):
+    with open(path, mode='a') as file:
+        file.write(json.dumps(record) + '\n')
+
+async def record_job_run(job, duration):
+    """Records a job's run time and, if METRICS_JSON_PATH is set, appends a metrics snapshot."""
+    job_duration_seconds.observe(duration, job=job)
+    job_last_duration_seconds.set(duration, job=job)
+    if METRICS_JSON_PATH:
+        record = {'job': job, 'timestamp': datetime.now().isoformat(), 'metrics': metrics.to_dict()}
+        await disk_writer.submit(append_metrics_json, METRICS_JSON_PATH, record)
 
 # -----------------------------
 # Utility Functions
 # -----------------------------
 
-def save_down_device_state():
-    """Saves the down devices state to a JSON file."""
-    with open('down_devices.json', mode='w') as file:
-        json.dump(down_device_tracker, file)
+def save_down_device_state(state=None):
+    """Saves the down devices state to a JSON file.
+
+    Writes to a temp file and renames it over the old one, so a crash leaves
+    either the previous or the new state on disk, never a partial file.
+    """
+    if state is None:
+        state = down_device_tracker
+    with open('down_devices.json.tmp', mode='w') as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace('down_devices.json.tmp', 'down_devices.json')
 
 def load_down_device_state():
     """Loads the down devices state from a JSON file."""
@@ -202,12 +303,6 @@ def load_device_count_from_file():
     except FileNotFoundError:
         return 1800  # Default value if no file is found
 
-def refresh_device_list_csv():
-    """Deletes the old device list CSV file if it exists."""
-    if os.path.exists('device_list.csv'):
-        os.remove('device_list.csv')
-        print("Old device list CSV deleted.")
-
 def save_device_list_to_csv_as_df(device_list):
     """Saves the device list to a CSV file using a pandas DataFrame."""
     # Convert the list of devices into a DataFrame
@@ -218,78 +313,615 @@ def save_device_list_to_csv_as_df(device_list):
     df.to_csv('device_list.csv', index=False)
     print("New device list CSV saved.")
 
-def save_raw_data_to_csv(device_id, raw_data):
-    """Appends raw data to the raw_data.csv file."""
-    with open('raw_data.csv', mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([device_id, raw_data])
+def apply_inventory_page(devices):
+    """Applies one device list page to the inventory and reports what changed."""
+    added, changed = inventory_store.apply_page(devices)
+    if added or changed:
+        print(f"Inventory page: {added} devices added, {changed} changed.")
+
+def finish_inventory_sync(full):
+    """Closes an inventory sync and re-exports device_list.csv if any stored value changed.
+
+    That includes records whose only updates were to volatile fields such as
+    upTime, so the export stays current.
+    """
+    counts = inventory_store.finish_sync(full)
+    print(f"Inventory sync finished: {counts['added']} added, {counts['changed']} changed, "
+          f"{counts['refreshed']} refreshed, {counts['removed']} removed, "
+          f"{inventory_store.count()} devices in the inventory.")
+    if any(counts.values()) or not os.path.exists('device_list.csv'):
+        save_device_list_to_csv_as_df(inventory_store.devices())
+
+def save_health_history(health_data, timestamp):
+    """Appends one status/signal sample per device in a health page to the history store."""
+    history_store.append(
+        (device['device_id'], timestamp, device.get('reachabilityHealth'), device.get('signal_strength'))
+        for device in health_data
+    )
+
+def save_detail_history(device, timestamp):
+    """Appends the status/signal sample from a device detail to the history store."""
+    history_store.append([(device['device_id'], timestamp, device.get('status'), device.get('signal_strength'))])
+
+def maintain_history_store():
+    """Compacts the finished hours of the history store and deletes the expired days."""
+    now = datetime.now()
+    history_store.drop_days_before(now.date() - timedelta(days=HISTORY_RETENTION_DAYS))
+    history_store.compact_before(now)
 
 def save_processed_data_to_csv(processed_data):
     """Appends processed data to the processed_data.csv file."""
-    with open('processed_data.csv', mode='a', newline='') as file:
-        writer = csv.DictWriter(file, fieldnames=processed_data.keys())
-        writer.writerow(processed_data)
+    processed_data_appender.append(processed_data)
 
 def filter_down_devices(device_data):
     """Filters devices where 'reachabilityHealth' is 'DOWN'."""
     return [device for device in device_data if device.get('reachabilityHealth') == 'DOWN']
 
+def down_devices_segment_path(day):
+    """Returns the segment file for a date (or an ISO date string)."""
+    return os.path.join(DOWN_DEVICES_DIR, f"{day}.csv")
+
+# Function to append down devices to CSV; the rows are stamped now and written by the disk writer
+async def append_down_devices_to_csv(down_devices):
+    timestamp = datetime.now().isoformat()
+    rows = [{'device_id': device['device_id'], 'timestamp': timestamp} for device in down_devices]
+    await disk_writer.submit(write_down_devices_to_csv, rows)
+
+def write_down_devices_to_csv(rows):
+    """Appends rows to the segment of the day they were stamped on."""
+    segments = {}
+    for row in rows:
+        segments.setdefault(row['timestamp'][:10], []).append(row)
+
+    os.makedirs(DOWN_DEVICES_DIR, exist_ok=True)
+    for day, segment_rows in segments.items():
+        path = down_devices_segment_path(day)
+        file_exists = os.path.exists(path)
+        with open(path, mode='a', newline='') as file:
+            fieldnames = ['device_id', 'timestamp']
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            if not file_exists:
+                writer.writeheader()
+            writer.writerows(segment_rows)
+
+def read_down_devices(start, end=None):
+    """Returns the down events with start <= timestamp < end, opening only the segments in that range."""
+    end = end or datetime.now()
+    frames = []
+    day = start.date()
+    while day <= end.date():
+        path = down_devices_segment_path(day)
+        if os.path.exists(path):
+            frames.append(pd.read_csv(path, parse_dates=['timestamp']))
+        day += timedelta(days=1)
+
+    if not frames:
+        return pd.DataFrame(columns=['device_id', 'timestamp'])
+    df = pd.concat(frames, ignore_index=True)
+    return df[(df['timestamp'] >= start) & (df['timestamp'] < end)]
+
+# Retention only deletes whole expired segments, so it never touches the segment being appended to
+async def clean_old_entries():
+    await disk_writer.submit(remove_old_down_device_entries)
+
+def remove_old_down_device_entries():
+    """Deletes the down-device segments older than DOWN_DEVICES_RETENTION_DAYS."""
+    if not os.path.isdir(DOWN_DEVICES_DIR):
+        return
+    cutoff_day = (datetime.now() - timedelta(days=DOWN_DEVICES_RETENTION_DAYS)).date().isoformat()
+    removed = 0
+    for name in os.listdir(DOWN_DEVICES_DIR):
+        day, extension = os.path.splitext(name)
+        # Segment names are ISO dates, so they compare in date order
+        if extension == '.csv' and len(day) == 10 and day < cutoff_day:
+            os.remove(os.path.join(DOWN_DEVICES_DIR, name))
+            removed += 1
+    if removed:
+        print(f"Removed {removed} expired segments from {DOWN_DEVICES_DIR}")
+
 def mark_device_down(device_id):
     """Marks a device as down with a timestamp."""
     if device_id not in down_device_tracker:
         down_device_tracker[device_id] = str(datetime.now())  # First time marked down
         print(f"Device {device_id} confirmed down at {down_device_tracker[device_id]}")
-        save_down_device_state()  # Persist the state
+        state_writer.mark_dirty()  # Persist the state
+        device_events.publish('device_down', {'device_id': device_id, 'timestamp': down_device_tracker[device_id]})
 
 def mark_device_up(device_id):
     """Removes a device from the down tracker when it comes back up."""
     if device_id in down_device_tracker:
         print(f"Device {device_id} is back up, clearing the down record.")
         del down_device_tracker[device_id]
-        save_down_device_state()  # Persist the state
+        state_writer.mark_dirty()  # Persist the state
+        device_events.publish('device_up', {'device_id': device_id, 'timestamp': str(datetime.now())})
+
+class DownDeviceStateWriter:
+    """Write-behind store for down_device_tracker.
+
+    Changes are coalesced and flushed through the disk writer once max_changes are
+    pending or the oldest pending change is max_age seconds old. Callers also
+    flush at the end of every health cycle and on shutdown.
+    """
+
+    def __init__(self, max_changes, max_age):
+        self.max_changes = max_changes
+        self.max_age = max_age
+        self.pending = 0
+        self.first_change = None
+        self.flush_task = None
+        self.lock = asyncio.Lock()
+
+    def mark_dirty(self):
+        """Records one tracker change and starts a background flush if a threshold is reached."""
+        self.pending += 1
+        if self.first_change is None:
+            self.first_change = time.monotonic()
+        if self.pending >= self.max_changes or time.monotonic() - self.first_change >= self.max_age:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:  # Called outside the event loop, write synchronously
+                self.pending = 0
+                self.first_change = None
+                save_down_device_state()
+                return
+            if self.flush_task is None or self.flush_task.done():
+                self.flush_task = loop.create_task(self.flush())
+
+    async def flush(self):
+        """Writes a snapshot of the tracker if there are unsaved changes."""
+        async with self.lock:
+            if not self.pending:
+                return
+            state = dict(down_device_tracker)
+            self.pending = 0
+            self.first_change = None
+            await disk_writer.submit(save_down_device_state, state)
+
+state_writer = DownDeviceStateWriter(STATE_FLUSH_CHANGES, STATE_FLUSH_SECONDS)
+
+# -----------------------------
+# Rate Limiting
+# -----------------------------
+
+# Rate-limit priority of the current task; child tasks inherit it. Lower is served first.
+HIGH_PRIORITY, LOW_PRIORITY = 0, 1
+request_priority = contextvars.ContextVar('request_priority', default=LOW_PRIORITY)
+
+class TokenBucket:
+    """Async token bucket refilling at calls_per_minute, holding at most burst tokens.
+
+    Waiters are served by priority, then in FIFO order, so a high-priority
+    job never queues behind a backlog of low-priority calls.
+    """
+
+    def __init__(self, calls_per_minute, burst=None):
+        self.rate = calls_per_minute / 60.0
+        self.capacity = burst or calls_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.waiters = []  # Heap of (priority, arrival, future)
+        self.arrivals = itertools.count()
+        self.dispatcher = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority=LOW_PRIORITY):
+        """Waits until a token is available and takes it."""
+        self._refill()
+        if not self.waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.arrivals), future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        """Hands out tokens to the waiters as they refill."""
+        while self.waiters:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():  # Cancelled waiters are skipped
+                future.set_result(None)
+                self.tokens -= 1
+
+class RateLimiter:
+    """Holds one token bucket per endpoint, shared by every task in the process."""
+
+    def __init__(self, limits):
+        self.buckets = {
+            endpoint: TokenBucket(limit['calls_per_minute'], limit.get('burst'))
+            for endpoint, limit in limits.items()
+        }
+
+    async def acquire(self, endpoint):
+        """Takes a token from the shared '*' budget and the endpoint's at the caller's request_priority.
+
+        Unlimited endpoints return immediately.
+        """
+        priority = request_priority.get()
+        for bucket in (self.buckets.get('*'), self.buckets.get(endpoint)):
+            if bucket:
+                await bucket.acquire(priority)
+
+rate_limiter = RateLimiter(RATE_LIMITS)
+
+class PrioritySemaphore:
+    """Bounds concurrent requests, handing free slots out by request_priority, then in FIFO order.
+
+    Unlike asyncio.Semaphore, a health-check request waiting for a slot is
+    admitted before any low-priority request that arrived earlier, so a
+    running inventory sync cannot crowd the health job out of the
+    connections they share.
+    """
+
+    def __init__(self, value):
+        self.value = value
+        self.waiters = []  # Heap of (priority, arrival, future)
+        self.arrivals = itertools.count()
+
+    async def acquire(self):
+        if self.value > 0 and not self.waiters:
+            self.value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (request_priority.get(), next(self.arrivals), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  # Cancelled just after being handed a slot
+                self.release()
+            raise
+
+    def release(self):
+        """Hands the slot to the first waiter by priority, or frees it. Cancelled waiters are skipped."""
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+semaphore = PrioritySemaphore(MAX_CONCURRENT_REQUESTS)
+
+def endpoint_for(url):
+    """Returns the rate-limit key for a URL, e.g. 'device_detail' for .../device_detail/42."""
+    return urlparse(url).path.strip('/').split('/')[0]
+
+# -----------------------------
+# Retries and Circuit Breaking
+# -----------------------------
+
+class RetryPolicy:
+    """Decides whether and how long to wait before retrying a failed request.
+
+    Backoff uses full jitter (a random delay between 0 and
+    base_delay * 2 ** attempt, capped at max_delay) so failed requests don't
+    retry in lockstep. A Retry-After from the server takes precedence, capped
+    at max_delay. Only connection errors, timeouts and retryable_statuses are
+    retried; any other HTTP error is final.
+    """
+
+    def __init__(self, retries=3, base_delay=1, max_delay=30, retryable_statuses=(429, 500, 502, 503, 504)):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable_statuses = frozenset(retryable_statuses)
+
+    def is_retryable(self, error):
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in self.retryable_statuses
+        return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before the retry following the given (0-based) attempt."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+def parse_retry_after(value):
+    """Parses a Retry-After header given in seconds or as an HTTP date. Returns seconds or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """Fails fast while an endpoint is unhealthy.
+
+    After failure_threshold consecutive failures the circuit opens and
+    requests are refused for reset_seconds. Then a single trial request is
+    let through: success closes the circuit, failure keeps it open for
+    another reset_seconds.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        """Returns True if a request may be sent now."""
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_seconds:
+            return False
+        self.opened_at = now  # Half-open: this caller is the trial, the rest keep failing fast
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                print(f"Circuit opened after {self.failures} consecutive failures.")
+            self.opened_at = time.monotonic()
+
+retry_policy = RetryPolicy()
+circuit_breakers = {}
+
+def circuit_breaker_for(endpoint):
+    """Returns the endpoint's circuit breaker, creating it on first use."""
+    if endpoint not in circuit_breakers:
+        circuit_breakers[endpoint] = CircuitBreaker()
+    return circuit_breakers[endpoint]
+
+# -----------------------------
+# HTTP Client and Authentication
+# -----------------------------
+
+class HttpClient:
+    """The application's one aiohttp session, shared by every scheduled job.
+
+    Reusing it across runs keeps pooled keep-alive connections and cached DNS
+    lookups instead of rebuilding them every cycle. The session is created on
+    first use, inside the running event loop.
+    """
+
+    def __init__(self):
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_CONNECTION_LIMIT,
+                limit_per_host=HTTP_CONNECTIONS_PER_HOST,
+                keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+                ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+http_client = HttpClient()
+
+class AuthenticationError(Exception):
+    """The auth endpoint did not issue a token, so authenticated requests cannot be made."""
+
+async def get_auth_token(session, auth_url, username, password):
+    """Requests a new token. Returns (token, lifetime in seconds or None if the API doesn't say).
+
+    Raises AuthenticationError if the auth call fails, so it is not mistaken
+    for a failure of the endpoint the token was wanted for.
+    """
+    payload = {'username': username, 'password': password}
+    try:
+        async with session.post(auth_url, json=payload) as response:
+            response.raise_for_status()
+            data = await response.json()
+            return data['auth_token'], data.get('expires_in')
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+        raise AuthenticationError(f"Authentication against {auth_url} failed: {e!r}") from e
+
+class TokenManager:
+    """Caches the API token and refreshes it single-flight.
+
+    The token is refreshed refresh_margin seconds before it expires, so
+    requests rarely see a 401. However many callers need a new token at the
+    same time, only one auth call is made and the others wait for its
+    result. Tokens without an expires_in are assumed to last default_ttl.
+    With no auth_url the manager is disabled and requests go unauthenticated.
+    """
+
+    def __init__(self, auth_url, username, password, refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS, default_ttl=3600):
+        self.auth_url = auth_url
+        self.username = username
+        self.password = password
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self.token = None
+        self.expires_at = 0.0
+        self.lock = asyncio.Lock()
+
+    @property
+    def enabled(self):
+        return self.auth_url is not None
+
+    def _usable(self, rejected):
+        return (self.token is not None and self.token != rejected
+                and time.monotonic() < self.expires_at - self.refresh_margin)
+
+    async def get_token(self, session, rejected=None):
+        """Returns a valid token. Pass the token the API just rejected to force a refresh past it."""
+        if self._usable(rejected):
+            return self.token
+        async with self.lock:
+            if not self._usable(rejected):  # Otherwise another caller refreshed it while we waited
+                token, expires_in = await get_auth_token(session, self.auth_url, self.username, self.password)
+                self.token = token
+                self.expires_at = time.monotonic() + (expires_in or self.default_ttl)
+            return self.token
+
+token_manager = TokenManager(AUTH_URL, USERNAME, PASSWORD)
+
+async def api_call_with_auth(session, method, url, **kwargs):
+    """Makes an authenticated API call, retrying once with a fresh token on 401.
+
+    Returns the JSON body; other HTTP errors raise ClientResponseError. When
+    token_manager is disabled the call is made without a token.
+    """
+    headers = dict(kwargs.pop('headers', None) or {})
+    if not token_manager.enabled:
+        async with session.request(method, url, headers=headers, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    token = await token_manager.get_token(session)
+    headers['Authorization'] = f'Bearer {token}'
+    async with session.request(method, url, headers=headers, **kwargs) as response:
+        if response.status != 401:
+            response.raise_for_status()
+            return await response.json()
+
+    # Token revoked or expired early: re-authenticate (once for all callers) and retry
+    token = await token_manager.get_token(session, rejected=token)
+    headers['Authorization'] = f'Bearer {token}'
+    async with session.request(method, url, headers=headers, **kwargs) as retry_response:
+        retry_response.raise_for_status()
+        return await retry_response.json()
 
 # -----------------------------
 # Async API Functions
 # -----------------------------
 
-async def fetch_with_retry(session, url, params=None, retries=3):
-    """Fetches data from the API with retries and timeout."""
-    for attempt in range(retries):
+async def fetch_with_retry(session, url, params=None, policy=None, endpoint=None):
+    """Fetches data from the API, retrying per the policy and failing fast while the endpoint's circuit is open.
+
+    Each attempt draws from the rate limiter and, when authentication is
+    configured, sends the current auth token, re-authenticating once if it
+    is rejected. Returns None if the request ultimately failed. A failed
+    auth call raises AuthenticationError rather than counting against the
+    endpoint.
+    """
+    policy = policy or retry_policy
+    endpoint = endpoint or endpoint_for(url)
+    breaker = circuit_breaker_for(endpoint)
+    for attempt in range(policy.retries):
+        if not breaker.allow():
+            print(f"Circuit open for {endpoint}, skipping URL: {url}")
+            circuit_rejections_total.inc(endpoint=endpoint)
+            return None
+        retry_after = None
         try:
+            with rate_limit_wait_seconds.time(endpoint=endpoint):
+                await rate_limiter.acquire(endpoint)
+            waiting_since = time.perf_counter()
             async with semaphore:
-                async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=60)) as response:
-                    response.raise_for_status()  # Raises exception for HTTP errors
-                    return await response.json()
+                semaphore_wait_seconds.observe(time.perf_counter() - waiting_since)
+                timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS)
+                with api_request_seconds.time(endpoint=endpoint):
+                    # Authenticated via token_manager; raises ClientResponseError for HTTP errors
+                    data = await api_call_with_auth(session, 'GET', url, params=params, timeout=timeout)
+            api_requests_total.inc(endpoint=endpoint, result='ok')
+            breaker.record_success()
+            return data
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             print(f"Attempt {attempt + 1} failed for URL: {url}. Error: {e}")
-            if attempt < retries - 1:
-                await asyncio.sleep(2 ** attempt)  # Exponential backoff
-            else:
-                print(f"All retries failed for URL: {url}")
+            if isinstance(e, aiohttp.ClientResponseError) and e.headers:
+                retry_after = parse_retry_after(e.headers.get('Retry-After'))
+            api_requests_total.inc(endpoint=endpoint, result=getattr(e, 'status', None) or type(e).__name__)
+            if not policy.is_retryable(e):
+                breaker.record_success()  # The API answered, the request itself is bad
+                api_failures_total.inc(endpoint=endpoint)
                 return None
+            breaker.record_failure()
+            if attempt < policy.retries - 1:
+                api_retries_total.inc(endpoint=endpoint)
+                await asyncio.sleep(policy.delay(attempt, retry_after))
+    print(f"All retries failed for URL: {url}")
+    api_failures_total.inc(endpoint=endpoint)
+    return None
 
 async def fetch_device_count(session, url):
-    """Fetches the total device count."""
+    """Fetches the total device count. Returns None if the request failed."""
     data = await fetch_with_retry(session, url)
     if data:
-        return data.get('device_count', 1800)
-    return 1800  # Default value if API call fails
+        return data.get('device_count')
+    return None
+
+async def fetch_device_list(session, url, offset, updated_since=None):
+    """Fetches one page of the device list, optionally only devices updated after updated_since.
 
-async def fetch_device_list(session, url, offset):
-    """Fetches the device list in batches."""
-    params = {'offset': offset, 'limit': 500}
+    Returns None if the request failed.
+    """
+    params = {'offset': offset, 'limit': PAGE_SIZE}
+    if updated_since is not None:
+        params[INVENTORY_DELTA_PARAM] = updated_since
     data = await fetch_with_retry(session, url, params=params)
-    if data:
-        return data.get('devices', [])
-    return []
+    if data is None:
+        return None
+    return data.get('devices', [])
 
 async def fetch_device_health(session, url, offset):
-    """Fetches device health data in batches."""
-    params = {'offset': offset, 'limit': 500}
+    """Fetches one page of device health data. Returns None if the request failed."""
+    params = {'offset': offset, 'limit': PAGE_SIZE}
     data = await fetch_with_retry(session, url, params=params)
-    if data:
-        return data.get('devices', [])
-    return []
+    if data is None:
+        return None
+    return data.get('devices', [])
+
+async def iter_pages(session, fetch_page, url, total_count):
+    """Yields (offset, page) pairs of a paginated endpoint in offset order.
+
+    Up to PAGE_WINDOW pages are requested ahead of the consumer, bounded by the
+    shared semaphore in fetch_with_retry, so a slow consumer holds back the
+    downloads instead of buffering the whole fleet. The first page shorter than
+    PAGE_SIZE marks the end of the fleet and cancels the requests after it.
+    Failed pages are skipped rather than treated as the end.
+    """
+    offsets = iter(range(0, total_count, PAGE_SIZE))
+    pending = deque()
+
+    def schedule():
+        while len(pending) < PAGE_WINDOW:
+            offset = next(offsets, None)
+            if offset is None:
+                return
+            pending.append((offset, asyncio.create_task(fetch_page(session, url, offset))))
+
+    try:
+        schedule()
+        while pending:
+            offset, task = pending.popleft()
+            page = await task
+            if page is None:
+                schedule()
+                continue
+            yield offset, page
+            if len(page) < PAGE_SIZE:
+                break
+            schedule()
+    finally:
+        for _, task in pending:
+            task.cancel()
 
 async def fetch_device_detail(session, url, device_id):
     """Fetches detailed info for a specific device."""
@@ -311,6 +943,110 @@ def process_data(raw_data):
     }
     return processed
 
+async def handle_device_detail(device):
+    """Saves a fetched device detail and updates the down tracker from its status."""
+    processed_data = process_data(device)
+    await disk_writer.submit(save_processed_data_to_csv, processed_data)
+    await disk_writer.submit(save_detail_history, processed_data, datetime.now())
+
+    # Mark device as down or up
+    if device.get('status') == 'DOWN':
+        mark_device_down(device.get('device_id'))
+    else:
+        mark_device_up(device.get('device_id'))
+
+# -----------------------------
+# Change Detection
+# -----------------------------
+
+class HealthChangeDetector:
+    """Compares each cycle's health snapshot with the last handled details to decide which devices need details.
+
+    A device needs a detail lookup when its health differs from the state of
+    its last successfully handled detail (UP->DOWN or DOWN->UP), or when it
+    has stayed DOWN for refresh_cycles cycles since then. State only moves
+    forward in detail_handled(), so a lookup that fails (timeout, 5xx, open
+    circuit) is simply requested again next cycle. Devices missing from a
+    cycle (e.g. on a failed page) keep their previous state.
+    """
+
+    def __init__(self, refresh_cycles):
+        self.refresh_cycles = refresh_cycles
+        self.cycle = 0
+        self.handled_down = None  # device_id -> cycle its DOWN detail was last handled
+
+    def begin_cycle(self):
+        self.cycle += 1
+        if self.handled_down is None:
+            # The tracker was built from handled details, so a restart does not re-fetch known outages
+            self.handled_down = {str(device_id): self.cycle for device_id in down_device_tracker}
+
+    def needs_detail(self, device):
+        """Returns True if the device's detail should be fetched this cycle."""
+        device_id = str(device['device_id'])
+        is_down = device.get('reachabilityHealth') == 'DOWN'
+        last = self.handled_down.get(device_id)
+        if is_down != (last is not None):
+            return True
+        return bool(is_down and self.refresh_cycles and self.cycle - last >= self.refresh_cycles)
+
+    def detail_handled(self, device):
+        """Records that the detail requested for a health record was fetched and applied."""
+        device_id = str(device['device_id'])
+        if device.get('reachabilityHealth') == 'DOWN':
+            self.handled_down[device_id] = self.cycle
+        else:
+            self.handled_down.pop(device_id, None)
+
+change_detector = HealthChangeDetector(DETAIL_REFRESH_CYCLES)
+
+# -----------------------------
+# Health Pipeline
+# -----------------------------
+
+async def produce_down_devices(session, url, total_devices, queue):
+    """Streams health pages and queues each changed device as soon as its page arrives.
+
+    The DOWN devices of each page are appended to the day's down-device
+    segment. Returns the number of DOWN devices and the number queued for a
+    detail lookup.
+    """
+    down_count = 0
+    queued_count = 0
+    change_detector.begin_cycle()
+    async for offset, health_data in iter_pages(session, fetch_device_health, url, total_devices):
+        if health_data:
+            await disk_writer.submit(save_health_history, health_data, datetime.now())
+            down_devices = filter_down_devices(health_data)
+            down_count += len(down_devices)
+            if down_devices:
+                await append_down_devices_to_csv(down_devices)
+            for device in health_data:
+                if change_detector.needs_detail(device):
+                    await queue.put(device)  # Waits here when the queue is full
+                    queued_count += 1
+    return down_count, queued_count
+
+async def detail_worker(session, url, queue):
+    """Fetches details for queued devices until it receives a None sentinel.
+
+    A failure on one device (e.g. a malformed response body) is logged and
+    the worker moves on, so the queue always keeps draining.
+    """
+    while True:
+        device = await queue.get()
+        try:
+            if device is None:
+                return
+            detail = await fetch_device_detail(session, url, device['device_id'])
+            if detail:
+                await handle_device_detail(detail)
+                change_detector.detail_handled(device)
+        except Exception as e:
+            print(f"Detail lookup failed for device {device.get('device_id')}: {e!r}")
+        finally:
+            queue.task_done()
+
 # -----------------------------
 # Scheduled Tasks
 # -----------------------------
@@ -320,26 +1056,52 @@ async def pull_device_count_and_list():
     start_time = datetime.now()
     print(f"Started 24-hour task at {start_time}")
 
-    async with aiohttp.ClientSession() as session:
-        device_count_url = "http://api.device3.com/get_device_count"
-        device_list_url = "http://api.device3.com/get_device_list"
+    session = http_client.session  # Shared across runs, see HttpClient
+    device_count_url = f"{API_BASE_URL}/get_device_count"
+    device_list_url = f"{API_BASE_URL}/get_device_list"
 
-        # Step 1: Get the total device count
-        device_count = await fetch_device_count(session, device_count_url)
-        save_device_count_to_file(device_count)
+    # Step 1: Get the total device count, falling back to the last saved one if the API doesn't answer
+    device_count = await fetch_device_count(session, device_count_url)
+    count_from_api = device_count is not None
+    if count_from_api:
+        await disk_writer.submit(save_device_count_to_file, device_count)
         print(f"Updated device count: {device_count}")
-
-        # Step 2: Get the full device list in batches
-        full_device_list = []
-        for offset in range(0, device_count, 500):
-            batch_devices = await fetch_device_list(session, device_list_url, offset)
-            full_device_list.extend(batch_devices)
-            await asyncio.sleep(1)  # Small delay to avoid overwhelming the API
-
-        # Step 3: Refresh the CSV and save the new list
-        refresh_device_list_csv()
-        save_device_list_to_csv_as_df(full_device_list)
-        print(f"Device list updated and saved as CSV with {len(full_device_list)} devices.")
+    else:
+        device_count = load_device_count_from_file()
+        print(f"Device count unavailable, listing up to the last known count of {device_count}.")
+
+    # Step 2: Decide between a delta sync (only devices updated since the newest lastUpdated we have) and a full one
+    updated_since = None
+    last_full_sync = inventory_store.get_state('last_full_sync')
+    if INVENTORY_DELTA_PARAM and last_full_sync and \
+            datetime.now() - datetime.fromisoformat(last_full_sync) < timedelta(days=INVENTORY_FULL_SYNC_DAYS):
+        updated_since = inventory_store.last_updated_watermark()
+
+    # Step 3: Stream the device list into the inventory; only added, changed and removed devices are written
+    failed_pages = []
+
+    async def fetch_inventory_page(session, url, offset):
+        page = await fetch_device_list(session, url, offset, updated_since)
+        if page is None:
+            failed_pages.append(offset)
+        return page
+
+    # One past the count, so a fleet that exactly fills its last page still ends on a short (empty) page
+    fetched = 0
+    ended_on_short_page = False
+    async for offset, batch_devices in iter_pages(session, fetch_inventory_page, device_list_url, device_count + 1):
+        await disk_writer.submit(apply_inventory_page, batch_devices)
+        fetched += len(batch_devices)
+        ended_on_short_page = len(batch_devices) < PAGE_SIZE
+
+    # Removals are only trusted from a full listing known to be complete: every page arrived, the
+    # listing reached the end of the fleet, and it was sized by a count the API actually returned
+    full = updated_since is None and not failed_pages and ended_on_short_page and count_from_api
+    await disk_writer.submit(finish_inventory_sync, full)
+    print(f"Device list {'delta' if updated_since is not None else 'full'} sync fetched {fetched} devices "
+          f"({len(failed_pages)} pages failed), queued for the inventory.")
+    if updated_since is None and not full:
+        print("The listing may be incomplete, so devices missing from it are not removed this time.")
 
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
@@ -350,70 +1112,228 @@ async def pull_device_health_and_details():
     start_time = datetime.now()
     print(f"Started 15-minute task at {start_time}")
 
-    async with aiohttp.ClientSession() as session:
-        # Load the latest device count
-        total_devices = load_device_count_from_file()
-
-        # Step 1: Pull device health data in batches
-        base_url_health = "http://api.device3.com/device_health"
-        down_devices = []
-        for offset in range(0, total_devices, 500):
-            health_data = await fetch_device_health(session, base_url_health, offset)
-            if health_data:
-                save_raw_data_to_csv(f"batch_offset_{offset}", health_data)
-                down_devices.extend(filter_down_devices(health_data))
-            await asyncio.sleep(1)  # Small delay between batches
-
-        print(f"Total devices down: {len(down_devices)}")
-
-        # Step 2: Fetch details for down devices, respecting rate limits
-        base_url_detail = "http://api.device3.com/device_detail"
-        for i in range(0, len(down_devices), 100):
-            tasks = [
-                fetch_device_detail(session, base_url_detail, device['device_id'])
-                for device in down_devices[i:i+100]
-            ]
-            device_details = await asyncio.gather(*tasks)
-
-            # Step 3: Process and save device details
-            for device in device_details:
-                if device:
-                    processed_data = process_data(device)
-                    save_processed_data_to_csv(processed_data)
-
-                    # Mark device as down or up
-                    if device.get('status') == 'DOWN':
-                        mark_device_down(device.get('device_id'))
-                    else:
-                        mark_device_up(device.get('device_id'))
-
-            await asyncio.sleep(60)  # Wait to respect API rate limit
+    session = http_client.session  # Shared across runs, see HttpClient
+
+    # Load the latest device count
+    total_devices = load_device_count_from_file()
+
+    base_url_health = f"{API_BASE_URL}/device_health"
+    base_url_detail = f"{API_BASE_URL}/device_detail"
+
+    # Step 1: Start detail workers; the rate limiter paces their calls
+    queue = asyncio.Queue(maxsize=DETAIL_QUEUE_SIZE)
+    workers = [
+        asyncio.create_task(detail_worker(session, base_url_detail, queue))
+        for _ in range(DETAIL_WORKERS)
+    ]
+
+    # Step 2: Stream health pages into the queue, then stop the workers. Producer and workers are
+    # gathered together, so if either side dies the other is cancelled instead of waiting forever.
+    async def produce():
+        counts = await produce_down_devices(session, base_url_health, total_devices, queue)
+        for _ in workers:
+            await queue.put(None)
+        return counts
+
+    producer = asyncio.create_task(produce())
+    try:
+        (down_count, queued_count), *_ = await asyncio.gather(producer, *workers)
+    finally:
+        for task in (producer, *workers):
+            task.cancel()
+
+    print(f"Total devices down: {down_count}, details requested: {queued_count}")
+
+    # Step 3: Persist this cycle's tracker changes in one write, and expire old down-device segments
+    await state_writer.flush()
+    await clean_old_entries()
 
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
     print(f"15-minute task completed in {duration} seconds.")
 
+async def maintain_history():
+    """Task to compact and expire the health history every hour."""
+    start_time = datetime.now()
+    await disk_writer.submit(maintain_history_store)
+    await disk_writer.drain()
+    duration = (datetime.now() - start_time).total_seconds()
+    print(f"History maintenance completed in {duration} seconds.")
+
 # -----------------------------
-# Scheduler Setup
+# Device Event Stream
 # -----------------------------
 
-def schedule_tasks():
-    """Schedules the tasks using APScheduler."""
-    scheduler = AsyncIOScheduler()
-
-    # Schedule the 24-hour task
-    scheduler.add_job(
-        pull_device_count_and_list,
-        trigger=IntervalTrigger(hours=24),
-        next_run_time=datetime.now()
+class EventSubscription:
+    """One connected client: a bounded queue of pending events and whether it fell behind."""
+
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+class DeviceEventBroadcaster:
+    """Fans device state changes out to connected server-sent-event clients.
+
+    Every event gets an increasing id and the last replay_size events are
+    kept, so a client reconnecting with Last-Event-ID gets exactly the events
+    it missed. A client whose id is older than the buffer or newer than any
+    sent (the server restarted), or that falls replay_size events behind,
+    gets a 'resync' event telling it to reload the full data instead.
+    """
+
+    def __init__(self, replay_size):
+        self.replay_size = replay_size
+        self.next_id = 1
+        self.replay = deque(maxlen=replay_size)
+        self.subscribers = set()
+
+    def publish(self, event_type, data):
+        """Records an event and queues it for every subscriber. Must run on the event loop."""
+        event = (self.next_id, event_type, json.dumps(data, default=str))
+        self.next_id += 1
+        self.replay.append(event)
+        for subscription in list(self.subscribers):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:  # Slow client, make it resync rather than buffer forever
+                subscription.closed = True
+                self.subscribers.discard(subscription)
+
+    def subscribe(self, last_event_id=None):
+        """Registers a client, pre-loading the events after last_event_id from the replay buffer."""
+        subscription = EventSubscription(self.replay_size)
+        if last_event_id is not None:
+            # An id from before a server restart is at or past next_id, since ids start again at 1
+            if last_event_id >= self.next_id or (self.replay and last_event_id < self.replay[0][0] - 1):
+                subscription.queue.put_nowait((self.next_id - 1, 'resync', '{}'))
+            else:
+                for event in self.replay:
+                    if event[0] > last_event_id:
+                        subscription.queue.put_nowait(event)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+device_events = DeviceEventBroadcaster(EVENT_REPLAY_SIZE)
+
+async def handle_device_events(request):
+    """Streams device_down/device_up events to a browser as server-sent events."""
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Access-Control-Allow-Origin': '*',  # The dashboards are served from other ports
+    })
+    await response.prepare(request)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.query.get('last_event_id')
+    subscription = device_events.subscribe(int(last_event_id) if last_event_id and last_event_id.isdigit() else None)
+    try:
+        while True:
+            try:
+                event_id, event_type, data = await asyncio.wait_for(subscription.queue.get(), EVENT_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if subscription.closed:
+                    await response.write(f"id: {device_events.next_id - 1}\nevent: resync\ndata: {{}}\n\n".encode())
+                    break
+                await response.write(b": keep-alive\n\n")
+                continue
+            await response.write(f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n".encode())
+    except ConnectionResetError:
+        pass  # Client went away
+    finally:
+        device_events.unsubscribe(subscription)
+    return response
+
+async def handle_metrics(request):
+    """Serves the pipeline metrics in the Prometheus text format."""
+    return web.Response(
+        body=metrics.render_prometheus().encode(),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
     )
 
-    # Schedule the 15-minute task
-    scheduler.add_job(
-        pull_device_health_and_details,
-        trigger=IntervalTrigger(minutes=15),
-        next_run_time=datetime.now()
+async def start_event_server(port=EVENT_SERVER_PORT):
+    """Starts the local HTTP server exposing /events and /metrics and returns its runner for cleanup."""
+    event_app = web.Application()
+    event_app.router.add_get('/events', handle_device_events)
+    event_app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(event_app)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    print(f"Device event stream and metrics listening on port {port}.")
+    return runner
+
+# -----------------------------
+# Scheduler Setup
+# -----------------------------
+
+class ScheduledJob:
+    """A pull job run by the scheduler at a fixed interval and rate-limit priority.
+
+    Each run sets request_priority for every request it makes, and its
+    duration is recorded in the job metrics whether it succeeds or fails. A run that takes most of the interval is reported, and one
+    that takes longer than the interval is counted as an overrun: the run it
+    displaced is skipped rather than stacked (max_instances=1).
+    """
+
+    def __init__(self, name, func, interval, priority):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.priority = priority
+
+    async def run(self):
+        """Runs the job once at its priority, reporting runs that don't fit the interval."""
+        request_priority.set(self.priority)  # The scheduler runs each job in its own task
+        started = time.monotonic()
+        try:
+            await self.func()
+        finally:
+            duration = time.monotonic() - started
+            budget = self.interval.total_seconds()
+            if duration > budget:
+                job_overruns_total.inc(job=self.name)
+                print(f"Warning: {self.name} took {duration:.0f}s, longer than its {budget:.0f}s interval; "
+                      f"runs due meanwhile are skipped.")
+            elif duration > budget * JOB_BUDGET_WARNING:
+                print(f"Warning: {self.name} took {duration:.0f}s, {duration / budget:.0%} of its {budget:.0f}s interval.")
+            await record_job_run(self.name, duration)
+
+scheduled_jobs = {
+    job.name: job for job in (
+        # Health checks go first when the jobs compete for rate-limit tokens and request slots
+        ScheduledJob('device_health_and_details', pull_device_health_and_details, timedelta(minutes=15), HIGH_PRIORITY),
+        ScheduledJob('device_count_and_list', pull_device_count_and_list, timedelta(hours=24), LOW_PRIORITY),
+        ScheduledJob('history_maintenance', maintain_history, timedelta(hours=1), LOW_PRIORITY),
     )
+}
+
+def report_skipped_run(event):
+    """Scheduler listener for runs skipped because they were missed or the previous run was still going."""
+    job_skipped_runs_total.inc(job=event.job_id)
+    reason = 'was missed' if event.code == EVENT_JOB_MISSED else 'was skipped, the previous run is still going'
+    print(f"Warning: a scheduled run of {event.job_id} {reason}.")
+
+def schedule_tasks():
+    """Schedules the tasks using APScheduler.
+
+    Each job runs at most one instance at a time, and runs missed while it
+    was busy (or the loop was blocked) are coalesced into a single run.
+    """
+    scheduler = AsyncIOScheduler()
+    scheduler.add_listener(report_skipped_run, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+    for job in scheduled_jobs.values():
+        scheduler.add_job(
+            job.run,
+            trigger=IntervalTrigger(seconds=job.interval.total_seconds()),
+            id=job.name,
+            next_run_time=datetime.now(),
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=JOB_MISFIRE_GRACE_SECONDS,
+        )
 
     scheduler.start()
     print("Scheduler started.")
@@ -430,19 +1350,22 @@ async def main():
     # Schedule tasks
     schedule_tasks()
 
+    # Stream device state changes to the dashboards
+    event_server = await start_event_server()
+
     # Keep the script running
     try:
         await asyncio.Event().wait()
     except (KeyboardInterrupt, SystemExit):
         print("Shutting down.")
+    finally:
+        await event_server.cleanup()
+        await http_client.close()
+        await state_writer.flush()
+        await asyncio.to_thread(disk_writer.close)  # Flush pending writes before exiting
 
 if __name__ == "__main__":
     # Initialize CSV files with headers if they don't exist
-    if not os.path.exists('raw_data.csv'):
-        with open('raw_data.csv', mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["device_id", "raw_json"])
-
     if not os.path.exists('processed_data.csv'):
         with open('processed_data.csv', mode='w', newline='') as file:
             writer = csv.DictWriter(file, fieldnames=["device_id", "status", "signal_strength", "timestamp"])
@@ -450,73 +1373,3 @@ if __name__ == "__main__":
 
     # Run the main function
     asyncio.run(main())
-
-
-
-    async def get_auth_token(session, auth_url, username, password):
-    payload = {'username': username, 'password': password}
-    async with session.post(auth_url, json=payload) as response:
-        response.raise_for_status()
-        data = await response.json()
-        return data['auth_token']
-
-async def api_call_with_auth(session, method, url, **kwargs):
-    try:
-        async with session.request(method, url, **kwargs) as response:
-            if response.status == 401:
-                # Token expired or invalid, re-authenticate
-                auth_token = await get_auth_token(session, AUTH_URL, USERNAME, PASSWORD)
-                session.headers.update({'Authorization': f'Bearer {auth_token}'})
-                # Retry the request
-                async with session.request(method, url, **kwargs) as retry_response:
-                    retry_response.raise_for_status()
-                    return await retry_response.json()
-            else:
-                response.raise_for_status()
-                return await response.json()
-    except Exception as e:
-        print(f"API call failed: {e}")
-        raise
-
-
-
-import csv
-from datetime import datetime
-
-# At the top of your script, create an asyncio lock
-file_lock = asyncio.Lock()
-
-# Function to append down devices to CSV
-async def append_down_devices_to_csv(down_devices):
-    async with file_lock:
-        file_exists = os.path.exists('down_devices.csv')
-        with open('down_devices.csv', mode='a', newline='') as file:
-            fieldnames = ['device_id', 'timestamp']
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            if not file_exists:
-                writer.writeheader()
-            for device in down_devices:
-                writer.writerow({
-                    'device_id': device['device_id'],
-                    'timestamp': datetime.now().isoformat()
-                })
-
-
-import pandas as pd
-from datetime import timedelta
-
-async def clean_old_entries():
-    async with file_lock:
-        try:
-            df = pd.read_csv('down_devices.csv')
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            cutoff_date = datetime.now() - timedelta(days=14)
-            # Keep only entries within the last 14 days
-            df = df[df['timestamp'] >= cutoff_date]
-            # Overwrite the CSV file with cleaned data
-            df.to_csv('down_devices.csv', index=False)
-            print("Old entries cleaned from down_devices.csv")
-        except FileNotFoundError:
-            print("down_devices.csv not found, skipping cleanup.")
-        except Exception as e:
-            print(f"Error during cleanup: {e}")
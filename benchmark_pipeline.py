@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# End-to-end benchmark of async_pulling.py against fake_device_api.py.
+# Runs one 24-hour list cycle and then the 15-minute health cycles, and
+# reports wall time, requests/sec, peak RSS and event-loop lag for each.
+#
+#   python benchmark_pipeline.py --fleet 50k --latency 0.02 --detail-calls-per-minute 6000
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a task that sleeps interval seconds."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.lags = []
+        self.task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - started - self.interval)
+
+    def start(self):
+        self.lags = []
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        lags = sorted(self.lags) or [0.0]
+        return {'p99': lags[min(len(lags) - 1, int(len(lags) * 0.99))], 'max': lags[-1]}
+
+
+def api_request_count(api_url):
+    with urllib.request.urlopen(f"{api_url}/stats") as response:
+        stats = json.load(response)
+    return sum(stats['requests'].values()), stats
+
+
+def wait_for_api(api_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("fake_device_api.py exited during startup")
+        try:
+            return api_request_count(api_url)
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("fake_device_api.py did not start in time")
+
+
+async def run_phase(name, job, api_url, results):
+    """Runs one pipeline cycle and records its metrics."""
+    requests_before, _ = api_request_count(api_url)
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    await job()
+    wall = time.perf_counter() - started
+    lag = await monitor.stop()
+    requests_after, _ = api_request_count(api_url)
+
+    requests = requests_after - requests_before
+    results.append({
+        'phase': name,
+        'wall_seconds': round(wall, 3),
+        'requests': requests,
+        'requests_per_second': round(requests / wall, 1) if wall else 0.0,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'loop_lag_p99_ms': round(lag['p99'] * 1000, 1),
+        'loop_lag_max_ms': round(lag['max'] * 1000, 1),
+    })
+
+
+async def run_benchmark(args, api_url):
+    import async_pulling
+
+    if args.detail_calls_per_minute:
+        async_pulling.rate_limiter = async_pulling.RateLimiter({
+            'device_detail': {'calls_per_minute': args.detail_calls_per_minute, 'burst': 10},
+        })
+
+    results = []
+    try:
+        await run_phase('device list (24h job)', async_pulling.pull_device_count_and_list, api_url, results)
+        await async_pulling.disk_writer.drain()  # Health cycles read the saved device count
+        for cycle in range(1, args.health_cycles + 1):
+            await run_phase(f'health cycle {cycle} (15m job)', async_pulling.pull_device_health_and_details,
+                            api_url, results)
+        await run_phase('disk writer drain', async_pulling.disk_writer.drain, api_url, results)
+    finally:
+        await async_pulling.http_client.close()
+        await asyncio.to_thread(async_pulling.disk_writer.close)
+    return results
+
+
+def print_results(results):
+    columns = ['phase', 'wall_seconds', 'requests', 'requests_per_second', 'peak_rss_mb',
+               'loop_lag_p99_ms', 'loop_lag_max_ms']
+    widths = [max(len(column), *(len(str(row[column])) for row in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in results:
+        print('  '.join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark async_pulling.py against a local fake API")
+    parser.add_argument('--fleet', default='7k', help="7k, 50k, 500k or a device count")
+    parser.add_argument('--down-ratio', type=float, default=0.02)
+    parser.add_argument('--latency', type=float, default=0.05, help="mean fake API latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=int, default=0, help="fake API requests per second before 429s")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--health-cycles', type=int, default=2,
+                        help="the first cycle fetches every DOWN device's detail, later ones only changes")
+    parser.add_argument('--detail-calls-per-minute', type=int, default=0,
+                        help="override the production device_detail rate limit (0 = keep it)")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    api_url = f"http://127.0.0.1:{args.port}"
+    api = subprocess.Popen([
+        sys.executable, os.path.join(REPO_DIR, 'fake_device_api.py'), '--port', str(args.port),
+        '--fleet', args.fleet, '--down-ratio', str(args.down_ratio), '--latency', str(args.latency),
+        '--error-rate', str(args.error_rate), '--rate-limit', str(args.rate_limit),
+    ])
+    try:
+        wait_for_api(api_url, api)
+
+        # The pipeline writes its CSVs and history relative to the working directory
+        os.environ['DEVICE_API_URL'] = api_url
+        sys.path.insert(0, REPO_DIR)
+        with tempfile.TemporaryDirectory(prefix='pipeline-benchmark-') as workdir:
+            os.chdir(workdir)
+            results = asyncio.run(run_benchmark(args, api_url))
+            os.chdir(REPO_DIR)
+    finally:
+        api.terminate()
+        api.wait()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from types import MappingProxyType
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 500
+GZIP_MIN_BYTES = 1024  # Smaller responses are sent uncompressed
+
+
+class SnapshotLoader:
+    """Keeps an immutable dashboard snapshot in sync with the files it is built from.
+
+    loaders maps each watched path to the function that parses it (e.g.
+    pd.read_csv), and build turns {path: parsed data} into the snapshot dict.
+    A daemon thread polls the files' mtime and size every poll_seconds; when
+    any changed, only those files are re-parsed, the snapshot is rebuilt and
+    swapped in with a single assignment. Request handlers read .snapshot once
+    per request and never wait on a reload. If a file fails to parse (e.g.
+    mid-write), the previous snapshot stays in place until the next poll.
+    """
+
+    def __init__(self, loaders, build, poll_seconds=5):
+        self.loaders = loaders
+        self.build = build
+        self.poll_seconds = poll_seconds
+        self.signatures = {}
+        self.parsed = {}
+        self.version = 0
+        self.snapshot = None
+        self.thread = None
+        self.reload_if_changed()
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self):
+        """Re-parses the changed files and swaps in a new snapshot. Returns True if it reloaded."""
+        changed = {}
+        for path, parse in self.loaders.items():
+            signature = self._signature(path)
+            if signature is not None and signature != self.signatures.get(path):
+                changed[path] = signature
+        if not changed and self.snapshot is not None:
+            return False
+
+        parsed = dict(self.parsed)
+        try:
+            for path in changed:
+                parsed[path] = self.loaders[path](path)
+            snapshot = self.build(parsed)
+        except Exception as e:
+            if self.snapshot is None:
+                raise
+            print(f"Snapshot reload failed, keeping the previous data: {e}")
+            return False
+
+        self.parsed = parsed
+        self.signatures.update(changed)
+        self.version += 1
+        self.snapshot = MappingProxyType(dict(snapshot, version=self.version))
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            self.reload_if_changed()
+
+    def start(self):
+        """Starts the background watcher thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._watch, name='snapshot-loader', daemon=True)
+            self.thread.start()
+        return self
+
+
+def normalize_mac(mac):
+    """Normalizes a MAC address to lowercase hex without separators, e.g. '001e0a594929'."""
+    return ''.join(c for c in str(mac).lower() if c in '0123456789abcdef')
+
+
+class DeviceIndex:
+    """In-memory lookup of device records by id, name or MAC address.
+
+    Built once per snapshot, so every detail route is a dict lookup instead
+    of a scan over the fleet. Ids and names are matched as strings, MAC
+    addresses in any common notation (colons, dashes, dots, any case).
+    """
+
+    def __init__(self, records, id_key='id', name_key='name', mac_key='macAddress'):
+        self.by_id = {}
+        self.by_name = {}
+        self.by_mac = {}
+        for record in records:
+            if id_key and record.get(id_key) is not None:
+                self.by_id[str(record[id_key])] = record
+            if name_key and record.get(name_key) is not None:
+                self.by_name[str(record[name_key])] = record
+            if mac_key and record.get(mac_key) is not None:
+                self.by_mac[normalize_mac(record[mac_key])] = record
+
+    def get(self, key):
+        """Finds a device by id, then name, then MAC address. Returns None if none matches."""
+        key = str(key)
+        device = self.by_id.get(key) or self.by_name.get(key)
+        if device is None:
+            mac = normalize_mac(key)
+            if len(mac) == 12:
+                device = self.by_mac.get(mac)
+        return device
+
+
+def page_args(args):
+    """Reads the paging, filtering and sorting parameters from a request's query args.
+
+    Supports offset, limit, status (comma-separated buckets), q (text
+    search), sort (any column) and order ('asc' or 'desc').
+    """
+    def to_int(value, default):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return default
+
+    statuses = args.get('status')
+    return {
+        'offset': to_int(args.get('offset'), 0),
+        'limit': to_int(args.get('limit'), DEFAULT_PAGE_LIMIT),
+        'statuses': set(statuses.split(',')) if statuses else None,
+        'search': args.get('q') or None,
+        'sort': args.get('sort') or None,
+        'descending': args.get('order') == 'desc',
+    }
+
+
+def query_records(records, offset=0, limit=DEFAULT_PAGE_LIMIT, statuses=None, search=None,
+                  sort=None, descending=False, search_keys=(), status_key='status'):
+    """Filters, sorts and pages a list of records.
+
+    statuses keeps records whose status_key is one of the given buckets,
+    search keeps records where any of search_keys contains the text
+    (case-insensitive), and sort orders by any column with missing values
+    last. limit is capped at MAX_PAGE_LIMIT so a response stays bounded
+    whatever the fleet size.
+    """
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), MAX_PAGE_LIMIT)
+
+    if statuses:
+        records = [record for record in records if record.get(status_key) in statuses]
+    if search:
+        needle = search.lower()
+        records = [
+            record for record in records
+            if any(needle in str(record.get(key, '')).lower() for key in search_keys)
+        ]
+    if sort:
+        present = [record for record in records if record.get(sort) is not None]
+        missing = [record for record in records if record.get(sort) is None]
+        records = sorted(present, key=lambda record: record[sort], reverse=descending) + missing
+
+    next_offset = offset + limit
+    return {
+        'total': len(records),
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset if next_offset < len(records) else None,
+        'items': records[offset:next_offset],
+    }
+
+
+def cached_response(body, content_type, if_none_match=None, accept_encoding=''):
+    """Adds an ETag and optional gzip to a response body.
+
+    Returns (status, body, headers): 304 with an empty body when the
+    client's If-None-Match already holds the ETag, otherwise 200 with the
+    body, gzipped if the client accepts it and it is worth compressing.
+    """
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return 304, b'', headers
+
+    headers['Content-Type'] = content_type
+    if 'gzip' in accept_encoding and len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    return 200, body, headers
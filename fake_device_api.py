@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from aiohttp import web
+
+# Local stand-in for the device controller API, for benchmarks and offline runs.
+# Point the pollers at it with DEVICE_API_URL=http://localhost:8765
+
+FLEET_SIZES = {'7k': 7_000, '50k': 50_000, '500k': 500_000}
+
+
+class FakeFleet:
+    """A deterministic fleet: device i is the same on every request, and a fixed share of it is DOWN."""
+
+    def __init__(self, size, down_ratio=0.02, seed=0):
+        self.size = size
+        rng = random.Random(seed)
+        self.down = bytearray(rng.random() < down_ratio for _ in range(size))
+        self.signal = [-40 - rng.randrange(50) for _ in range(256)]
+        self.created_ms = int(time.time() * 1000)
+
+    def device_id(self, index):
+        return f"AP{index:06d}"
+
+    def index_of(self, device_id):
+        try:
+            index = int(str(device_id)[2:])
+        except ValueError:
+            return None
+        return index if 0 <= index < self.size else None
+
+    def device(self, index):
+        return {
+            'id': self.device_id(index),
+            'deviceName': f"Device_{index}",
+            'macAddress': ':'.join(f"{b:02x}" for b in (0, 0x1e, 0x0a, index >> 16 & 0xff, index >> 8 & 0xff, index & 0xff)),
+            'reachabilityStatus': 'Unreachable' if self.down[index] else 'Reachable',
+            'upTime': f"{index % 90} days",
+            'lastUpdated': self.created_ms,
+            'apType': 'Type_A' if index % 2 else 'Type_B',
+            'location': f"Location_{index % 100}",
+        }
+
+    def status(self, index):
+        return 'DOWN' if self.down[index] else 'UP'
+
+    def health(self, index):
+        return {
+            'device_id': self.device_id(index),
+            'reachabilityHealth': self.status(index),
+            'signal_strength': self.signal[index % 256],
+        }
+
+    def detail(self, index):
+        return dict(self.device(index), device_id=self.device_id(index), status=self.status(index),
+                    signal_strength=self.signal[index % 256], timestamp=str(time.time()))
+
+    def page(self, request):
+        offset = int(request.query.get('offset', 0))
+        limit = int(request.query.get('limit', self.size))
+        return range(max(offset, 0), min(offset + limit, self.size))
+
+
+def create_app(fleet, latency=0.05, error_rate=0.0, rate_limit=0, token_ttl=3600, require_auth=False):
+    """Builds the fake API.
+
+    Every request except /stats waits about latency seconds (+/- 50%), fails
+    with a 503 at error_rate, and gets a 429 with Retry-After once more than
+    rate_limit requests arrive in the same second (0 = unlimited). With
+    require_auth, requests other than /auth and /stats get a 401 unless they
+    carry a Bearer token from /auth that is less than token_ttl seconds old.
+    """
+    stats = {'requests': Counter(), 'errors': 0, 'throttled': 0, 'unauthorized': 0}
+    window = {'second': 0, 'count': 0}
+    tokens = {}  # token -> expiry (monotonic seconds)
+
+    @web.middleware
+    async def simulate(request, handler):
+        if request.path == '/stats':
+            return await handler(request)
+        stats['requests'][request.path.split('/')[1]] += 1
+
+        now = int(time.monotonic())
+        if window['second'] != now:
+            window['second'], window['count'] = now, 0
+        window['count'] += 1
+        if rate_limit and window['count'] > rate_limit:
+            stats['throttled'] += 1
+            return web.Response(status=429, headers={'Retry-After': '1'})
+
+        if require_auth and request.path != '/auth':
+            token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            if tokens.get(token, 0) < time.monotonic():
+                stats['unauthorized'] += 1
+                return web.Response(status=401)
+
+        if latency:
+            await asyncio.sleep(latency * random.uniform(0.5, 1.5))
+        if error_rate and random.random() < error_rate:
+            stats['errors'] += 1
+            return web.Response(status=503)
+        return await handler(request)
+
+    async def get_device_count(request):
+        return web.json_response({'device_count': fleet.size})
+
+    async def get_device_list(request):
+        devices = [fleet.device(i) for i in fleet.page(request)]
+        if 'lastUpdated' in request.query:  # Delta listing: only devices updated after the given time
+            devices = [device for device in devices if device['lastUpdated'] > int(request.query['lastUpdated'])]
+        return web.json_response({'devices': devices})
+
+    async def device_health(request):
+        return web.json_response({'devices': [fleet.health(i) for i in fleet.page(request)]})
+
+    async def device_detail(request):
+        index = fleet.index_of(request.match_info.get('device_id') or request.query.get('device_id'))
+        if index is None:
+            raise web.HTTPNotFound()
+        return web.json_response(fleet.detail(index))
+
+    async def auth(request):
+        token = f"fake-{len(tokens)}-{time.time():.0f}"
+        tokens[token] = time.monotonic() + token_ttl
+        return web.json_response({'auth_token': token, 'expires_in': token_ttl})
+
+    async def get_stats(request):
+        return web.json_response(dict(stats, requests=dict(stats['requests'])))
+
+    app = web.Application(middlewares=[simulate])
+    app.router.add_get('/get_device_count', get_device_count)
+    app.router.add_get('/get_device_list', get_device_list)
+    app.router.add_get('/device_health', device_health)
+    app.router.add_get('/device_detail/{device_id}', device_detail)
+    app.router.add_get('/get_device_details', device_detail)  # async_data_loading.py's endpoint
+    app.router.add_post('/auth', auth)
+    app.router.add_get('/stats', get_stats)
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fake device controller API")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fleet', default='7k', help="7k, 50k, 500k or a device count")
+    parser.add_argument('--down-ratio', type=float, default=0.02, help="share of devices reporting DOWN")
+    parser.add_argument('--latency', type=float, default=0.05, help="mean seconds per request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests failing with 503")
+    parser.add_argument('--rate-limit', type=int, default=0, help="requests per second before 429s (0 = unlimited)")
+    parser.add_argument('--require-auth', action='store_true', help="answer 401 without a token from /auth")
+    parser.add_argument('--token-ttl', type=int, default=3600, help="seconds an auth token stays valid")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    size = FLEET_SIZES.get(args.fleet) or int(args.fleet)
+    fleet = FakeFleet(size, args.down_ratio, args.seed)
+    print(f"Fake API with {size} devices ({sum(fleet.down)} down) on port {args.port}")
+    app = create_app(fleet, args.latency, args.error_rate, args.rate_limit, args.token_ttl, args.require_auth)
+    web.run_app(app, port=args.port, print=None)
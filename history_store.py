@@ -0,0 +1,251 @@
+import json
+import os
+import shutil
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# One fixed-width record per sample: 13 bytes on disk
+SAMPLE_DTYPE = np.dtype([
+    ('timestamp', '<f8'),        # Unix seconds
+    ('status', 'i1'),            # See STATUS_CODES
+    ('signal_strength', '<f4'),  # NaN when the sample had no signal reading
+])
+
+# Samples as appended to an hour's log, tagged with their device
+DEVICE_ID_BYTES = 48
+LOG_DTYPE = np.dtype([('device_id', f'S{DEVICE_ID_BYTES}')] + [
+    (name, SAMPLE_DTYPE.fields[name][0]) for name in SAMPLE_DTYPE.names
+])
+
+STATUS_CODES = {'DOWN': 0, 'UP': 1}
+UNKNOWN_STATUS = -1
+
+LOG_SUFFIX = '.log'          # An hour's samples, still being appended to
+SEALED_SUFFIX = '.sealed'    # A log taken out of the append path, waiting to be compacted
+GENERATION_PREFIX = 'compacted.'
+MANIFEST = 'segments.json'   # The sealed logs a generation contains
+
+
+def encode_status(status):
+    """Maps a status string from the API to its stored code."""
+    return STATUS_CODES.get(status, UNKNOWN_STATUS)
+
+
+def _encode_device_id(device_id):
+    return str(device_id).encode()[:DEVICE_ID_BYTES]
+
+
+def _to_samples(records):
+    samples = np.empty(len(records), dtype=SAMPLE_DTYPE)
+    for name in SAMPLE_DTYPE.names:
+        samples[name] = records[name]
+    return samples
+
+
+class HistoryStore:
+    """On-disk, per-device history of status and signal_strength samples.
+
+    Samples are partitioned by day, and within a day appended to one log per
+    hour, so a whole health page costs a single open/write:
+
+        <root>/<YYYY-MM-DD>/<HH>.log
+
+    compact_before() seals every log whose hour has ended and merges the
+    sealed logs into a new generation of the day, sorted by device, where
+    devices.npy (sorted ids) and offsets.npy locate each device's slice of
+    samples.npy:
+
+        <root>/<YYYY-MM-DD>/compacted.<n>/{devices,offsets,samples}.npy
+
+    Each generation lists the sealed logs it contains in segments.json and
+    is built under a temporary name, then published with a single rename.
+    A reader therefore sees either the old generation plus the logs it does
+    not contain yet, or the new one, never a mix.
+
+    Compacted samples are read through memory maps, so a range query for one
+    device touches a binary search and that device's records (about 1.2 KB
+    per day at 15-minute samples). Only logs not compacted yet, normally the
+    current hour's, are scanned in full.
+
+    append() and compact_before() must run on one thread (the disk writer);
+    reads can happen from anywhere.
+    """
+
+    def __init__(self, root='history'):
+        self.root = root
+
+    def _day_dir(self, day):
+        return os.path.join(self.root, day.isoformat())
+
+    def append(self, samples):
+        """Appends samples given as (device_id, timestamp, status, signal_strength) tuples.
+
+        timestamp is a datetime, status a string such as 'UP' or 'DOWN', and
+        signal_strength may be None. Each hour's log is opened once per call.
+        """
+        hours = defaultdict(list)
+        for device_id, timestamp, status, signal_strength in samples:
+            hours[timestamp.date(), timestamp.hour].append((
+                _encode_device_id(device_id),
+                timestamp.timestamp(),
+                encode_status(status),
+                np.nan if signal_strength is None else signal_strength,
+            ))
+
+        for (day, hour), records in hours.items():
+            day_dir = self._day_dir(day)
+            os.makedirs(day_dir, exist_ok=True)
+            with open(os.path.join(day_dir, f'{hour:02d}{LOG_SUFFIX}'), mode='ab') as file:
+                file.write(np.array(records, dtype=LOG_DTYPE).tobytes())
+
+    def _generations(self, day_dir, names=None):
+        """Returns the day's published generation numbers, newest first."""
+        numbers = []
+        for name in os.listdir(day_dir) if names is None else names:
+            if name.startswith(GENERATION_PREFIX) and name[len(GENERATION_PREFIX):].isdigit():
+                numbers.append(int(name[len(GENERATION_PREFIX):]))
+        return sorted(numbers, reverse=True)
+
+    def _current_generation(self, day_dir, names=None):
+        """Returns (path of the newest generation or None, names of the sealed logs it contains)."""
+        generations = self._generations(day_dir, names)
+        if not generations:
+            return None, set()
+        path = os.path.join(day_dir, f'{GENERATION_PREFIX}{generations[0]}')
+        with open(os.path.join(path, MANIFEST)) as file:
+            return path, set(json.load(file))
+
+    def _uncompacted_logs(self, names, compacted):
+        return sorted(
+            name for name in names if name.endswith((LOG_SUFFIX, SEALED_SUFFIX)) and name not in compacted
+        )
+
+    def _read_generation(self, path, key):
+        devices = np.load(os.path.join(path, 'devices.npy'), mmap_mode='r')
+        index = int(np.searchsorted(devices, key))
+        if index == len(devices) or devices[index] != key:
+            return None
+        offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        samples = np.load(os.path.join(path, 'samples.npy'), mmap_mode='r')
+        return np.array(samples[offsets[index]:offsets[index + 1]])
+
+    def _read_log(self, path, key):
+        count = os.path.getsize(path) // LOG_DTYPE.itemsize
+        if not count:
+            return None
+        log = np.memmap(path, dtype=LOG_DTYPE, mode='r', shape=(count,))
+        return _to_samples(log[log['device_id'] == key])
+
+    def _read_day(self, day_dir, key):
+        # Work from one listing: it holds either the old generation and the logs not in it, or the new one
+        names = os.listdir(day_dir)
+        parts = []
+        generation, compacted = self._current_generation(day_dir, names)
+        if generation is not None:
+            parts.append(self._read_generation(generation, key))
+        for name in self._uncompacted_logs(names, compacted):
+            parts.append(self._read_log(os.path.join(day_dir, name), key))
+        return [part for part in parts if part is not None]
+
+    def read(self, device_id, start, end=None):
+        """Returns the device's samples with start <= timestamp < end as a SAMPLE_DTYPE array."""
+        end = end or datetime.now()
+        key = _encode_device_id(device_id)
+        parts = []
+        day = start.date()
+        while day <= end.date():
+            day_dir = self._day_dir(day)
+            for attempt in range(3):
+                try:
+                    if os.path.isdir(day_dir):
+                        parts.extend(self._read_day(day_dir, key))
+                    break
+                except FileNotFoundError:  # A compaction removed what we listed; list the day again
+                    if attempt == 2:
+                        raise
+            day += timedelta(days=1)
+
+        if not parts:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        samples = np.concatenate(parts)
+        samples = samples[np.argsort(samples['timestamp'], kind='stable')]
+        mask = (samples['timestamp'] >= start.timestamp()) & (samples['timestamp'] < end.timestamp())
+        return samples[mask]
+
+    def _compact_day(self, day_dir):
+        """Merges the day's sealed logs into a new generation and publishes it with one rename."""
+        generations = self._generations(day_dir)
+        generation, compacted = self._current_generation(day_dir)
+        sealed = sorted(name for name in os.listdir(day_dir)
+                        if name.endswith(SEALED_SUFFIX) and name not in compacted)
+        if sealed:
+            parts = [np.fromfile(os.path.join(day_dir, name), dtype=LOG_DTYPE) for name in sealed]
+            if generation is not None:
+                devices = np.load(os.path.join(generation, 'devices.npy'))
+                offsets = np.load(os.path.join(generation, 'offsets.npy'))
+                samples = np.load(os.path.join(generation, 'samples.npy'))
+                previous = np.empty(len(samples), dtype=LOG_DTYPE)
+                previous['device_id'] = np.repeat(devices, np.diff(offsets))
+                for name in SAMPLE_DTYPE.names:
+                    previous[name] = samples[name]
+                parts.insert(0, previous)
+            records = np.concatenate(parts)
+            records = records[np.lexsort((records['timestamp'], records['device_id']))]
+            devices, starts = np.unique(records['device_id'], return_index=True)
+
+            number = generations[0] + 1 if generations else 1
+            temp_dir = os.path.join(day_dir, f'.building.{number}')
+            shutil.rmtree(temp_dir, ignore_errors=True)  # Left over from an interrupted compaction
+            os.makedirs(temp_dir)
+            np.save(os.path.join(temp_dir, 'devices.npy'), devices)
+            np.save(os.path.join(temp_dir, 'offsets.npy'), np.append(starts, len(records)).astype(np.int64))
+            np.save(os.path.join(temp_dir, 'samples.npy'), _to_samples(records))
+            with open(os.path.join(temp_dir, MANIFEST), 'w') as file:
+                json.dump(sorted(compacted | set(sealed)), file)
+            os.rename(temp_dir, os.path.join(day_dir, f'{GENERATION_PREFIX}{number}'))
+            compacted |= set(sealed)
+
+        # Everything below is now superseded by the newest generation. A reader still holding
+        # one of these files open keeps its data until it closes it.
+        for number in self._generations(day_dir)[1:]:
+            shutil.rmtree(os.path.join(day_dir, f'{GENERATION_PREFIX}{number}'), ignore_errors=True)
+        for name in compacted:
+            if os.path.exists(os.path.join(day_dir, name)):
+                os.remove(os.path.join(day_dir, name))
+
+    def _days(self):
+        if not os.path.isdir(self.root):
+            return []
+        days = []
+        for name in os.listdir(self.root):
+            try:
+                days.append(datetime.strptime(name, '%Y-%m-%d').date())
+            except ValueError:
+                continue
+        return days
+
+    def compact_before(self, moment):
+        """Seals every hourly log whose hour ended by moment and compacts each day that has sealed logs."""
+        for day in self._days():
+            if day > moment.date():
+                continue
+            day_dir = self._day_dir(day)
+            for name in os.listdir(day_dir):
+                if not name.endswith(LOG_SUFFIX):
+                    continue
+                hour = int(name[:-len(LOG_SUFFIX)])
+                if datetime.combine(day, datetime.min.time()) + timedelta(hours=hour + 1) <= moment:
+                    # Never reused, since manifests keep the names of deleted sealed logs. A late
+                    # append to this hour starts a new log, which is sealed on the next pass.
+                    sealed_name = f'{name[:-len(LOG_SUFFIX)]}.{time.time_ns()}{SEALED_SUFFIX}'
+                    os.rename(os.path.join(day_dir, name), os.path.join(day_dir, sealed_name))
+            self._compact_day(day_dir)
+
+    def drop_days_before(self, day):
+        """Deletes every day partition older than the given date."""
+        for partition_day in self._days():
+            if partition_day < day:
+                shutil.rmtree(self._day_dir(partition_day))
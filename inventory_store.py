@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from dashboard_data import normalize_mac
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    device_key TEXT PRIMARY KEY,  -- Normalized MAC address, or the device id when there is none
+    data TEXT NOT NULL,           -- The device record from the API as canonical JSON
+    last_updated INTEGER,         -- The record's lastUpdated, when the API sends one
+    synced_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS device_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_key TEXT NOT NULL,
+    change TEXT NOT NULL,         -- 'added', 'changed' or 'removed'
+    changed_at TEXT NOT NULL,
+    data TEXT                     -- The record after the change (before it, for removals)
+);
+CREATE INDEX IF NOT EXISTS device_changes_changed_at ON device_changes (changed_at);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+QUERY_CHUNK = 500  # Keys per IN (...) query, well under SQLite's variable limit
+
+# Fields that change on every poll without the device itself changing. Records
+# differing only in these are updated in place without logging a change.
+VOLATILE_FIELDS = frozenset({'upTime', 'lastUpdated', 'reachabilityStatus'})
+
+
+def device_key(device):
+    """Returns the inventory key of a device record: its MAC address, else its id, else None."""
+    mac = normalize_mac(device.get('macAddress') or '')
+    if len(mac) == 12:
+        return mac
+    device_id = device.get('id') or device.get('device_id')
+    return str(device_id) if device_id is not None else None
+
+
+def stable_fields(device):
+    """Returns the device record without its VOLATILE_FIELDS, for diffing."""
+    return {field: value for field, value in device.items() if field not in VOLATILE_FIELDS}
+
+
+class InventoryStore:
+    """SQLite-backed device inventory that is updated by applying diffs.
+
+    A sync feeds the API's device list page by page to apply_page(), which
+    writes only the added and changed records and logs each change. Records
+    are compared without their VOLATILE_FIELDS: a record whose only
+    differences are in those is still updated, but not logged. Records with
+    neither a MAC address nor an id cannot be keyed and are skipped. A full
+    sync then calls finish_sync(full=True) to remove the devices it did not
+    see; a delta sync (pages filtered by lastUpdated) cannot see removals, so
+    it finishes with full=False. Readers query the current inventory
+    directly instead of reparsing a CSV, including from other processes
+    (the database uses WAL mode). Logged changes older than
+    change_retention_days are deleted when a sync finishes.
+
+    Each thread gets its own connection, so the store can be written from
+    the disk writer thread and read from anywhere.
+    """
+
+    def __init__(self, path='inventory.sqlite', change_retention_days=90):
+        self.path = path
+        self.change_retention_days = change_retention_days
+        self.local = threading.local()
+        self.seen = set()
+        self.sync_counts = {'added': 0, 'changed': 0, 'refreshed': 0}
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self.local.connection = connection
+        return connection
+
+    def apply_page(self, devices):
+        """Applies one page of device records. Returns (added, changed) counts."""
+        records = {}
+        unkeyed = 0
+        for device in devices:
+            key = device_key(device)
+            if key is None:
+                unkeyed += 1
+                continue
+            records[key] = device
+        if unkeyed:
+            print(f"Skipped {unkeyed} device records with neither a MAC address nor an id.")
+        self.seen.update(records)
+
+        existing = {}
+        keys = list(records)
+        for start in range(0, len(keys), QUERY_CHUNK):
+            chunk = keys[start:start + QUERY_CHUNK]
+            rows = self.connection.execute(
+                f"SELECT device_key, data FROM devices WHERE device_key IN ({','.join('?' * len(chunk))})", chunk)
+            existing.update(rows)
+
+        now = datetime.now().isoformat()
+        upserts = []
+        changes = []
+        refreshes = []
+        for key, device in records.items():
+            data = json.dumps(device, sort_keys=True, default=str)
+            if existing.get(key) == data:
+                continue
+            upserts.append((key, data, device.get('lastUpdated'), now))
+            if key in existing and stable_fields(json.loads(existing[key])) == stable_fields(json.loads(data)):
+                refreshes.append(key)  # Only volatile fields moved: store them, but it isn't a change
+                continue
+            changes.append((key, 'changed' if key in existing else 'added', now, data))
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO devices (device_key, data, last_updated, synced_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (device_key) DO UPDATE SET data = excluded.data, "
+                "last_updated = excluded.last_updated, synced_at = excluded.synced_at", upserts)
+            self.connection.executemany(
+                "INSERT INTO device_changes (device_key, change, changed_at, data) VALUES (?, ?, ?, ?)", changes)
+        added = sum(change == 'added' for _, change, _, _ in changes)
+        self.sync_counts['added'] += added
+        self.sync_counts['changed'] += len(changes) - added
+        self.sync_counts['refreshed'] += len(refreshes)
+        return added, len(changes) - added
+
+    def finish_sync(self, full):
+        """Ends a sync. A full sync removes every device it did not see.
+
+        Returns the sync's {'added', 'changed', 'refreshed', 'removed'} counts,
+        where refreshed records only had VOLATILE_FIELDS updated.
+        """
+        seen, self.seen = self.seen, set()
+        counts, self.sync_counts = self.sync_counts, {'added': 0, 'changed': 0, 'refreshed': 0}
+        now = datetime.now().isoformat()
+        removed = []
+        if full:
+            for key, data in self.connection.execute("SELECT device_key, data FROM devices"):
+                if key not in seen:
+                    removed.append((key, data))
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM devices WHERE device_key = ?", [(key,) for key, _ in removed])
+            self.connection.executemany(
+                "INSERT INTO device_changes (device_key, change, changed_at, data) VALUES (?, 'removed', ?, ?)",
+                [(key, now, data) for key, data in removed])
+            if self.change_retention_days:
+                cutoff = (datetime.now() - timedelta(days=self.change_retention_days)).isoformat()
+                self.connection.execute("DELETE FROM device_changes WHERE changed_at < ?", (cutoff,))
+            self._set_state('last_sync', now)
+            if full:
+                self._set_state('last_full_sync', now)
+        return dict(counts, removed=len(removed))
+
+    def _set_state(self, key, value):
+        self.connection.execute(
+            "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))
+
+    def get_state(self, key):
+        row = self.connection.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def last_updated_watermark(self):
+        """Returns the newest lastUpdated in the inventory, or None if the API doesn't send it."""
+        return self.connection.execute("SELECT MAX(last_updated) FROM devices").fetchone()[0]
+
+    def devices(self):
+        """Returns the current inventory as a list of device records."""
+        return [json.loads(data) for data, in self.connection.execute("SELECT data FROM devices ORDER BY device_key")]
+
+    def get(self, key):
+        """Returns one device by MAC address (any notation) or id, or None."""
+        mac = normalize_mac(key)
+        row = self.connection.execute(
+            "SELECT data FROM devices WHERE device_key = ?", (mac if len(mac) == 12 else str(key),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM devices").fetchone()[0]
+
+    def changes_since(self, since):
+        """Returns the logged changes after the given datetime, oldest first."""
+        rows = self.connection.execute(
+            "SELECT device_key, change, changed_at, data FROM device_changes WHERE changed_at > ? ORDER BY id",
+            (since.isoformat(),))
+        return [
+            {'device_key': key, 'change': change, 'changed_at': changed_at, 'data': json.loads(data) if data else None}
+            for key, change, changed_at, data in rows
+        ]
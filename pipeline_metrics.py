@@ -0,0 +1,166 @@
+import bisect
+import math
+import time
+
+# Request latencies range from a few milliseconds to the 60 s request timeout
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, (), value
+
+    def to_dict(self):
+        return {_format_labels(key): value for key, value in self.values.items()}
+
+
+class Gauge:
+    """A value that goes up and down per label set.
+
+    Passing func makes an unlabeled gauge that is read when the metrics are
+    collected, e.g. the current depth of a queue.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, func=None):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+        self.values = {}
+
+    def set(self, value, **labels):
+        self.values[_label_key(labels)] = value
+
+    def _current(self):
+        if self.func is not None:
+            return {(): self.func()}
+        return self.values
+
+    def samples(self):
+        for key, value in self._current().items():
+            yield self.name, key, (), value
+
+    def to_dict(self):
+        return {_format_labels(key): value for key, value in self._current().items()}
+
+
+class Histogram:
+    """Counts observations into cumulative buckets per label set, plus their sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # label key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        if key not in self.values:
+            self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts = self.values[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        for key, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', key, (('le', _format_value(bound)),), cumulative
+            yield f'{self.name}_sum', key, (), counts[-1]
+            yield f'{self.name}_count', key, (), cumulative
+
+    def to_dict(self):
+        result = {}
+        for key, counts in self.values.items():
+            count = sum(counts[:-1])
+            result[_format_labels(key)] = {'count': count, 'sum': counts[-1],
+                                           'mean': counts[-1] / count if count else 0.0}
+        return result
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class MetricsRegistry:
+    """The set of metrics a process exposes, rendered as Prometheus text or a JSON-ready dict."""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.metrics = []
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(self.prefix + name, help_text))
+
+    def gauge(self, name, help_text, func=None):
+        return self._register(Gauge(self.prefix + name, help_text, func))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self.prefix + name, help_text, buckets))
+
+    def render_prometheus(self):
+        """Returns every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, key, extra, value in metric.samples():
+                lines.append(f'{name}{_format_labels(key, extra)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        """Returns {metric name: {label set: value}}; histograms report count, sum and mean."""
+        return {metric.name: metric.to_dict() for metric in self.metrics}
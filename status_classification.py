@@ -0,0 +1,51 @@
+import numpy as np
+
+# Scores at or below the first threshold are critical, scores at or above the
+# second are healthy and anything in between is a warning. Every dashboard
+# uses these unless it passes its own.
+DEFAULT_THRESHOLDS = (0, 95)
+
+CRITICAL, WARNING, HEALTHY = 0, 1, 2
+STATUS_LABELS = np.array(['critical', 'warning', 'healthy'])
+STATUS_COLORS = np.array(['red', 'yellow', 'green'])
+
+
+def classify(scores, thresholds=DEFAULT_THRESHOLDS):
+    """Classifies a whole array (or column) of scores at once.
+
+    Returns an int8 array of CRITICAL/WARNING/HEALTHY codes with the same
+    shape as scores. Missing scores count as warnings.
+    """
+    critical, healthy = thresholds
+    scores = np.asarray(scores, dtype=float)
+    return np.select([scores <= critical, scores >= healthy], [CRITICAL, HEALTHY], WARNING).astype(np.int8)
+
+
+def status_colors(scores, thresholds=DEFAULT_THRESHOLDS):
+    """Returns the color name for every score, with the same shape as scores."""
+    return STATUS_COLORS[classify(scores, thresholds)]
+
+
+def status_counts(codes):
+    """Returns (critical, warning, healthy) counts for an array of codes."""
+    return tuple(int(n) for n in np.bincount(np.ravel(codes), minlength=3))
+
+
+if __name__ == '__main__':
+    # Micro-benchmark: vectorized classification against a per-row Python function
+    import timeit
+
+    scores = np.random.default_rng(0).integers(0, 101, size=100_000)
+
+    def per_row(score):
+        if score <= DEFAULT_THRESHOLDS[0]:
+            return 'red'
+        elif score >= DEFAULT_THRESHOLDS[1]:
+            return 'green'
+        return 'yellow'
+
+    runs = 20
+    vectorized = timeit.timeit(lambda: status_colors(scores), number=runs) / runs
+    python_loop = timeit.timeit(lambda: [per_row(score) for score in scores], number=runs) / runs
+    print(f"100k devices: vectorized {vectorized * 1000:.2f} ms, per-row {python_loop * 1000:.2f} ms "
+          f"({python_loop / vectorized:.0f}x)")
@@ -0,0 +1,44 @@
+import contextlib
+import os
+import sys
+
+import pytest
+from aiohttp import web
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from fake_device_api import FakeFleet, create_app  # noqa: E402
+
+
+@contextlib.asynccontextmanager
+async def run_fake_api(size=1000, down_ratio=0.02, **options):
+    """Serves fake_device_api.py on a free local port inside the running loop. Yields its base URL."""
+    runner = web.AppRunner(create_app(FakeFleet(size, down_ratio), **options))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    try:
+        yield f"http://127.0.0.1:{runner.addresses[0][1]}"
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture
+def fake_api():
+    return run_fake_api
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """async_pulling with its files under tmp_path, fresh rate limits and circuit breakers, and no auth.
+
+    Tests pass the fake API's URLs in directly; one that needs auth sets token_manager.auth_url.
+    """
+    monkeypatch.chdir(tmp_path)
+    import async_pulling
+
+    monkeypatch.setattr(async_pulling, 'rate_limiter', async_pulling.RateLimiter({}))
+    monkeypatch.setattr(async_pulling, 'circuit_breakers', {})
+    monkeypatch.setattr(async_pulling, 'token_manager', async_pulling.TokenManager(None, '', ''))
+    return async_pulling
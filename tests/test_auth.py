@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+
+def fetch_count(pipeline, fake_api, auth_path=None, **options):
+    """Fetches the fake device count, authenticating against auth_path when given. Returns (count, stats)."""
+    async def run():
+        async with fake_api(size=100, latency=0, **options) as url:
+            if auth_path:
+                pipeline.token_manager.auth_url = f"{url}{auth_path}"
+            session = pipeline.http_client.session
+            try:
+                count = await pipeline.fetch_device_count(session, f"{url}/get_device_count")
+                async with session.get(f"{url}/stats") as response:
+                    return count, await response.json()
+            finally:
+                await pipeline.http_client.close()
+
+    return asyncio.run(run())
+
+
+def test_requests_are_unauthenticated_without_auth_configured(pipeline, fake_api):
+    count, stats = fetch_count(pipeline, fake_api)
+
+    assert count == 100
+    assert 'auth' not in stats['requests']
+
+
+def test_a_rejected_token_is_refreshed_once(pipeline, fake_api):
+    pipeline.token_manager.token = 'revoked'
+    pipeline.token_manager.expires_at = float('inf')
+    count, stats = fetch_count(pipeline, fake_api, '/auth', require_auth=True)
+
+    assert count == 100
+    assert stats['unauthorized'] == 1
+    assert stats['requests']['auth'] == 1
+
+
+def test_a_failed_auth_call_raises_instead_of_failing_the_endpoint(pipeline, fake_api):
+    with pytest.raises(pipeline.AuthenticationError, match='/missing_auth'):
+        fetch_count(pipeline, fake_api, '/missing_auth')
+
+    assert pipeline.circuit_breakers['get_device_count'].failures == 0
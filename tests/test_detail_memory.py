@@ -0,0 +1,64 @@
+import asyncio
+import gc
+import os
+
+import aiohttp
+import pytest
+
+import async_data_loading
+
+FLEET = 2000
+WARMUP_CYCLES = 3
+SOAK_CYCLES = 20
+CYCLE_SLEEP_SECONDS = 20 * 60  # update_device_details' wait between cycles
+
+
+class SoakFinished(Exception):
+    pass
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason="reads the current RSS from /proc")
+def test_detail_cycles_keep_rss_flat(tmp_path, fake_api, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(async_data_loading, 'device_list', {
+        'devices': [{'id': f"AP{index:06d}"} for index in range(FLEET)],
+    })
+    monkeypatch.setattr(async_data_loading, 'latest_device_details', {})
+    monkeypatch.setattr(async_data_loading, 'device_detail_history', {})
+    rss = []
+    held = []
+    real_sleep = asyncio.sleep
+
+    async def end_of_cycle(delay, *args, **kwargs):
+        """Stands in for the 20-minute wait: samples memory, then starts the next cycle at once."""
+        if delay != CYCLE_SLEEP_SECONDS:
+            return await real_sleep(delay, *args, **kwargs)
+        held.append(len(async_data_loading.latest_device_details))
+        gc.collect()
+        rss.append(current_rss_mb())
+        if len(rss) == WARMUP_CYCLES + SOAK_CYCLES:
+            raise SoakFinished
+
+    async def run():
+        async with fake_api(size=FLEET, latency=0) as url:
+            monkeypatch.setattr(async_data_loading, 'API_BASE_URL', url)
+            monkeypatch.setattr(async_data_loading.asyncio, 'sleep', end_of_cycle)
+            async with aiohttp.ClientSession() as session:
+                # Every fake detail carries a new timestamp, so all rows change on every cycle
+                with pytest.raises(SoakFinished):
+                    await async_data_loading.update_device_details(session, {})
+
+    asyncio.run(run())
+
+    soak = rss[WARMUP_CYCLES - 1:]
+    details_mb = os.path.getsize(async_data_loading.DETAILS_CSV) / 2 ** 20
+    print(f"\nRSS over {SOAK_CYCLES} cycles of {FLEET} details: {soak[0]:.1f} -> {soak[-1]:.1f} MB "
+          f"(max {max(soak):.1f} MB), details CSV {details_mb:.1f} MB")
+
+    assert held == [FLEET] * len(held)  # Only the latest detail per device is kept
+    assert max(soak) - soak[0] < 10
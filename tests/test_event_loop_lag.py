@@ -0,0 +1,44 @@
+import asyncio
+
+from benchmark_pipeline import LoopLagMonitor
+
+DEVICES = 100_000  # A large fleet's device list makes the pandas to_csv slow enough to measure
+
+
+def device_list():
+    return [
+        {'macAddress': f"00:1e:0a:{index >> 16 & 0xff:02x}:{index >> 8 & 0xff:02x}:{index & 0xff:02x}",
+         'deviceName': f"Device_{index}", 'reachabilityStatus': 'Reachable', 'upTime': '1 days',
+         'lastUpdated': index}
+        for index in range(DEVICES)
+    ]
+
+
+def measure_lag(write):
+    async def run():
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        await write()
+        await asyncio.sleep(0.05)
+        return await monitor.stop()
+
+    return asyncio.run(run())
+
+
+def test_disk_writer_keeps_the_event_loop_responsive(pipeline):
+    devices = device_list()
+
+    async def write_on_the_loop():
+        pipeline.save_device_list_to_csv_as_df(devices)
+
+    async def write_through_the_disk_writer():
+        await pipeline.disk_writer.submit(pipeline.save_device_list_to_csv_as_df, devices)
+        await pipeline.disk_writer.drain()
+
+    before = measure_lag(write_on_the_loop)
+    after = measure_lag(write_through_the_disk_writer)
+    print(f"\nloop lag writing {DEVICES} devices: on the loop max {before['max'] * 1000:.0f} ms, "
+          f"through the disk writer max {after['max'] * 1000:.0f} ms")
+
+    assert after['max'] < before['max'] / 2
@@ -0,0 +1,64 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+from history_store import HistoryStore
+
+DAY = datetime(2024, 5, 1)
+
+
+def timestamps(samples):
+    return [datetime.fromtimestamp(value) for value in samples['timestamp']]
+
+
+def test_compacted_and_open_hours_read_back_once(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append([('AP1', DAY + timedelta(hours=hour), 'UP', -50) for hour in range(3)])
+    store.append([('AP2', DAY + timedelta(hours=1), 'DOWN', None)])
+
+    store.compact_before(DAY + timedelta(hours=2))  # Hours 0 and 1 have ended, hour 2 is still open
+    day_dir = tmp_path / DAY.date().isoformat()
+    assert sorted(name for name in os.listdir(day_dir) if not name.startswith('compacted.')) == ['02.log']
+
+    store.append([('AP1', DAY + timedelta(hours=1, minutes=30), 'DOWN', -70)])  # Late sample for a sealed hour
+    expected = [DAY, DAY + timedelta(hours=1), DAY + timedelta(hours=1, minutes=30), DAY + timedelta(hours=2)]
+    assert timestamps(store.read('AP1', DAY, DAY + timedelta(days=1))) == expected
+
+    store.compact_before(DAY + timedelta(days=1))
+    assert [name for name in os.listdir(day_dir) if not name.startswith('compacted.')] == []
+    assert len([name for name in os.listdir(day_dir) if name.startswith('compacted.')]) == 1
+    assert timestamps(store.read('AP1', DAY, DAY + timedelta(days=1))) == expected
+    assert store.read('AP2', DAY, DAY + timedelta(days=1))['status'].tolist() == [0]
+    assert len(store.read('AP3', DAY, DAY + timedelta(days=1))) == 0
+
+
+def test_reads_during_compaction_see_every_sample_once(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    hours = 24
+    for hour in range(hours):
+        store.append([(f'AP{index}', DAY + timedelta(hours=hour), 'UP', -50) for index in range(50)])
+
+    counts = []
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            counts.append(len(store.read('AP7', DAY, DAY + timedelta(days=1))))
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for hour in range(1, hours + 1):
+        store.compact_before(DAY + timedelta(hours=hour))
+    done.set()
+    thread.join()
+
+    assert counts and set(counts) == {hours}
+
+
+def test_expired_days_are_dropped(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append([('AP1', DAY - timedelta(days=40), 'UP', -50), ('AP1', DAY, 'UP', -50)])
+
+    store.drop_days_before((DAY - timedelta(days=30)).date())
+
+    assert os.listdir(tmp_path) == [DAY.date().isoformat()]
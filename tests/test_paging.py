@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+
+def collect_pages(pipeline, fake_api, size, total_count, latency):
+    """Walks the fake device list with iter_pages. Returns (pages, elapsed seconds, list requests made)."""
+    async def run():
+        async with fake_api(size=size, latency=latency) as url:
+            session = pipeline.http_client.session
+            try:
+                started = time.perf_counter()
+                pages = [item async for item in pipeline.iter_pages(
+                    session, pipeline.fetch_device_list, f"{url}/get_device_list", total_count)]
+                elapsed = time.perf_counter() - started
+                async with session.get(f"{url}/stats") as response:
+                    stats = await response.json()
+            finally:
+                await pipeline.http_client.close()
+            return pages, elapsed, stats['requests'].get('get_device_list', 0)
+
+    return asyncio.run(run())
+
+
+def test_pages_are_fetched_concurrently_and_in_offset_order(pipeline, fake_api):
+    latency, page_count = 0.25, 12
+    pages, elapsed, _ = collect_pages(pipeline, fake_api, page_count * pipeline.PAGE_SIZE - 20,
+                                      page_count * pipeline.PAGE_SIZE, latency)
+    serial_lower_bound = page_count * latency * 0.5  # The fake API's latency varies +/- 50%
+    print(f"\n{page_count} pages in {elapsed:.2f}s, serial paging takes at least {serial_lower_bound:.2f}s")
+
+    assert [offset for offset, _ in pages] == [index * pipeline.PAGE_SIZE for index in range(page_count)]
+    devices = [device['id'] for _, page in pages for device in page]
+    assert devices == [f"AP{index:06d}" for index in range(page_count * pipeline.PAGE_SIZE - 20)]
+    assert elapsed < serial_lower_bound
+
+
+def test_paging_stops_at_the_first_short_page(pipeline, fake_api):
+    size = 3 * pipeline.PAGE_SIZE + 1
+    pages, _, requests = collect_pages(pipeline, fake_api, size, 10 * size, latency=0.01)
+
+    assert [len(page) for _, page in pages] == [pipeline.PAGE_SIZE] * 3 + [1]
+    # Only the read-ahead window may go past the end of the fleet
+    assert requests <= 4 + pipeline.PAGE_WINDOW
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+# The detail phase used to fire one gather() batch and then sleep a fixed 60 s
+FIXED_SLEEP_SECONDS = 60
+
+
+def test_detail_calls_stay_under_the_rate_ceiling_without_a_fixed_sleep(pipeline, fake_api):
+    calls_per_minute, burst, calls = 600, 5, 40  # 10 calls/s
+    pipeline.rate_limiter = pipeline.RateLimiter({
+        'device_detail': {'calls_per_minute': calls_per_minute, 'burst': burst},
+    })
+
+    async def run():
+        async with fake_api(size=100, latency=0) as url:
+            finished = []
+
+            async def fetch(device_id):
+                detail = await pipeline.fetch_device_detail(pipeline.http_client.session, f"{url}/device_detail",
+                                                            device_id)
+                finished.append(time.monotonic())
+                return detail
+
+            started = time.monotonic()
+            try:
+                details = await asyncio.gather(*(fetch(f"AP{index:06d}") for index in range(calls)))
+            finally:
+                await pipeline.http_client.close()
+            return details, started, sorted(finished)
+
+    details, started, finished = asyncio.run(run())
+    elapsed = finished[-1] - started
+    rate = calls_per_minute / 60
+
+    assert all(detail and detail['device_id'] for detail in details)
+    # Rate ceiling: after the burst, calls cannot complete faster than the refill rate, over
+    # the whole run or in any one-second window
+    assert elapsed >= (calls - burst) / rate * 0.9
+    for index, moment in enumerate(finished):
+        in_window = sum(1 for other in finished[index:] if other - moment < 1)
+        assert in_window <= rate + burst
+    # Speedup: the calls run back to back at the budget instead of waiting out a fixed sleep
+    assert elapsed < (calls - burst) / rate + 2
+    assert elapsed < FIXED_SLEEP_SECONDS / 10
@@ -1,86 +1,134 @@
-from flask import Flask, render_template, jsonify, request
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+from flask import Flask, Response, render_template, jsonify, request, url_for
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from dashboard_data import SnapshotLoader, cached_response, page_args, query_records
+from status_classification import status_colors
+
 app = Flask(__name__)
 
-# Load device data from CSV files
-healthy_devices_df = pd.read_csv('healthy_devices.csv')
-abnormal_devices_df = pd.read_csv('abnormal_devices.csv')
-down_devices_df = pd.read_csv('down_devices.csv')
+SAMPLE_INTERVAL = timedelta(minutes=30)  # Time between past_time_N columns
+MAX_CHART_POINTS = 200  # Longer windows are downsampled to this many points
+TABLE_COLUMNS = [f'past_time_{i}' for i in range(31, 55)]  # Time steps shown in the table view
+
+def build_device_history(group_dfs, loaded_at):
+    """Indexes each device's scores by (group, device_id) as time-ordered arrays.
+
+    current_op_score is stamped loaded_at and past_time_N is N sample
+    intervals earlier, so the wide CSV columns become real timestamps.
+    """
+    history = {}
+    for group, group_df in group_dfs.items():
+        score_columns = ['current_op_score'] + [c for c in group_df.columns if c.startswith('past_time_')]
+        # Reverse the columns so every row runs oldest -> newest
+        scores = group_df[score_columns].to_numpy(dtype=float)[:, ::-1]
+        offsets = np.arange(len(score_columns) - 1, -1, -1) * SAMPLE_INTERVAL
+        times = np.datetime64(loaded_at, 's') - offsets.astype('timedelta64[s]')
+        for device_id, row in zip(group_df['device_id'], scores):
+            history[(group, int(device_id))] = (times, row)
+    return history
+
+TIME_RANGE_UNITS = {
+    'min': 'minutes', 'mins': 'minutes',
+    'h': 'hours', 'hr': 'hours', 'hrs': 'hours', 'hour': 'hours', 'hours': 'hours',
+    'd': 'days', 'day': 'days', 'days': 'days',
+}
+
+def parse_time_range(time_range):
+    """Parses values like '24hrs', '3days', '90min' or '12h' into a timedelta. Returns None if invalid."""
+    match = re.fullmatch(r'(\d+)\s*([a-z]+)', time_range.strip().lower())
+    if not match or match.group(2) not in TIME_RANGE_UNITS:
+        return None
+    return timedelta(**{TIME_RANGE_UNITS[match.group(2)]: int(match.group(1))})
 
-# Assign group labels directly
-healthy_devices_df['group'] = 'Healthy'
-abnormal_devices_df['group'] = 'Abnormal'
-down_devices_df['group'] = 'Down'
+def downsample(times, scores, max_points):
+    """Averages scores into at most max_points evenly sized buckets, keeping each bucket's first timestamp."""
+    if len(scores) <= max_points:
+        return times, scores
+    starts = np.linspace(0, len(scores), max_points, endpoint=False).astype(int)
+    counts = np.diff(np.append(starts, len(scores)))
+    return times[starts], np.add.reduceat(scores, starts) / counts
 
-# Combine all devices into one dataframe
-df = pd.concat([healthy_devices_df, abnormal_devices_df, down_devices_df])
+def build_snapshot(group_dfs, loaded_at):
+    """Computes everything the routes serve, once per data load.
 
-# Calculate counts and percentages for each category based on the total number of devices
-total_devices = len(df)
-category_counts = df['group'].value_counts()
-category_percentages = (category_counts / total_devices * 100).round(2)
+    Holds the per-group device records with their colors, the category
+    totals, the table view rows and the device history index.
+    """
+    total_devices = sum(len(group_df) for group_df in group_dfs.values())
+    grouped_devices = {}
+    category_info = {}
+    table_rows = []
+    for group in ['Down', 'Abnormal', 'Healthy']:
+        group_df = group_dfs[group]
+        records = group_df[['device_id', 'current_op_score']].assign(color=status_colors(group_df['current_op_score']))
+        grouped_devices[group] = records.to_dict(orient='records')
+
+        # Calculate counts and percentages for each category based on the total number of devices
+        percentage = round(len(group_df) / total_devices * 100, 2) if total_devices else 0
+        category_info[group] = f"{len(group_df)} ({percentage}%)"
+
+    for group in ['Healthy', 'Abnormal', 'Down']:
+        group_df = group_dfs[group]
+        for device_id, colors in zip(group_df['device_id'], status_colors(group_df[TABLE_COLUMNS]).tolist()):
+            table_rows.append({'device_id': device_id, 'group': group, 'colors': colors})
+
+    return {
+        'grouped_devices': grouped_devices,
+        'category_info': category_info,
+        'table_rows': table_rows,
+        'device_history': build_device_history(group_dfs, loaded_at),
+    }
 
-def get_color(score):
-    if score == 0:
-        return 'red'
-    elif score >= 95:
-        return 'green'
-    else:
-        return 'yellow'
+# Load device data from CSV files, reloading them in the background whenever they change
+GROUP_FILES = {
+    'Healthy': 'healthy_devices.csv',
+    'Abnormal': 'abnormal_devices.csv',
+    'Down': 'down_devices.csv',
+}
+loader = SnapshotLoader(
+    {path: pd.read_csv for path in GROUP_FILES.values()},
+    lambda frames: build_snapshot({group: frames[path] for group, path in GROUP_FILES.items()}, datetime.now()),
+).start()
 
 @app.route('/')
 def index():
-    grouped_devices = {
-        'Down': down_devices_df.to_dict(orient='records'),
-        'Abnormal': abnormal_devices_df.to_dict(orient='records'),
-        'Healthy': healthy_devices_df.to_dict(orient='records')
-    }
-    
-    category_info = {
-        'Down': f"{category_counts.get('Down', 0)} ({category_percentages.get('Down', 0)}%)",
-        'Abnormal': f"{category_counts.get('Abnormal', 0)} ({category_percentages.get('Abnormal', 0)}%)",
-        'Healthy': f"{category_counts.get('Healthy', 0)} ({category_percentages.get('Healthy', 0)}%)"
-    }
-    
-    return render_template('index.html', grouped_devices=grouped_devices, category_info=category_info, get_color=get_color)
+    snapshot = loader.snapshot
+    return render_template('index.html', grouped_devices=snapshot['grouped_devices'], category_info=snapshot['category_info'])
 
 @app.route('/device/<device_id>')
 def device_detail(device_id):
     group = request.args.get('group')
     time_range = request.args.get('time_range', '24hrs')
 
-    if group == 'Healthy':
-        device_data = healthy_devices_df[healthy_devices_df['device_id'] == int(device_id)].iloc[0]
-        scores = device_data[2:58].values  # 24 hours (56 time steps)
-    elif group == 'Abnormal':
-        if time_range == '3days':
-            device_data = abnormal_devices_df[abnormal_devices_df['device_id'] == int(device_id)].iloc[0]
-            scores = device_data[2:170].values  # 3 days data (168 time steps)
-        else:  # Default to 24 hours
-            device_data = abnormal_devices_df[abnormal_devices_df['device_id'] == int(device_id)].iloc[0]
-            scores = device_data[2:58].values  # 24 hours data
-    elif group == 'Down':
-        if time_range == '7days':
-            device_data = down_devices_df[down_devices_df['device_id'] == int(device_id)].iloc[0]
-            scores = device_data[2:338].values  # 7 days data (336 time steps)
-        else:  # Default to 24 hours
-            device_data = down_devices_df[down_devices_df['device_id'] == int(device_id)].iloc[0]
-            scores = device_data[2:58].values  # 24 hours data
-
-    time_points = list(range(1, len(scores) + 1))
-    
+    window = parse_time_range(time_range)
+    if window is None:
+        return jsonify({'error': f'Invalid time_range: {time_range}'}), 400
+    try:
+        times, scores = loader.snapshot['device_history'][(group, int(device_id))]
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Device not found'}), 404
+
+    # The window ends at the device's latest sample
+    start = np.searchsorted(times, times[-1] - np.timedelta64(window))
+    times, scores = downsample(times[start:], scores[start:], MAX_CHART_POINTS)
+
     fig = go.Figure()
     fig.add_trace(go.Scatter(
-        x=time_points,
+        x=times.astype(datetime),
         y=scores,
         mode='lines+markers',
         name=device_id
     ))
     fig.update_layout(
         title=f'Operation Scores for Device {device_id} ({time_range})',
-        xaxis_title='Time Points',
+        xaxis_title='Time',
         yaxis_title='Operation Score',
         xaxis=dict(showgrid=True, zeroline=True),
         yaxis=dict(showline=True)
@@ -91,11 +139,30 @@ def device_detail(device_id):
 
 @app.route('/table-view')
 def table_view():
-    df_table = df.copy()
-    # Adjust columns to match up to the correct number of time steps
-    df_table = df_table[['device_id', 'current_op_score'] + [f'past_time_{i+1}' for i in range(df_table.shape[1] - 2)] + ['group']]
-    
-    return render_template('table_view.html', data=df_table.to_dict(orient='records'), get_color=get_color)
+    """Renders one page of the table view.
+
+    Query args: offset, limit, status (Healthy, Abnormal, Down; comma
+    separated), q (searches device ids), sort (device_id or group) and
+    order (asc/desc). Unchanged pages answer 304 via ETag.
+    """
+    page = query_records(
+        loader.snapshot['table_rows'],
+        search_keys=('device_id',),
+        status_key='group',
+        **page_args(request.args),
+    )
+    args = request.args.to_dict()
+    prev_url = url_for('table_view', **dict(args, offset=max(page['offset'] - page['limit'], 0))) if page['offset'] else None
+    next_url = url_for('table_view', **dict(args, offset=page['next_offset'])) if page['next_offset'] is not None else None
+
+    html = render_template('table_view.html', data=page['items'], page=page, prev_url=prev_url, next_url=next_url)
+    status, body, headers = cached_response(
+        html.encode(),
+        'text/html; charset=utf-8',
+        request.headers.get('If-None-Match'),
+        request.headers.get('Accept-Encoding', ''),
+    )
+    return Response(body, status=status, headers=headers)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,36 +1,42 @@
+import os
+import sys
 import pandas as pd
 from flask import Flask, render_template, jsonify
 
-app = Flask(__name__)
-
-# Load data from CSV files
-df_current_op_status = pd.read_csv('synthetic_current_op_status.csv')
-df_basic_info = pd.read_csv('synthetic_basic_info.csv')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dashboard_data import DeviceIndex, SnapshotLoader
+from status_classification import status_colors
 
-# Merge the two tables on 'device_name'
-merged_df = pd.merge(df_current_op_status, df_basic_info, on='device_name')
+app = Flask(__name__)
 
-# Convert the merged dataframe to a list of dictionaries
-device_data = merged_df.to_dict(orient='records')
+def build_snapshot(df_current_op_status, df_basic_info):
+    """Merges the device tables and precomputes the views the routes serve, once per data load."""
+    # Merge the two tables on 'device_name'
+    merged_df = pd.merge(df_current_op_status, df_basic_info, on='device_name')
+    merged_df['color'] = status_colors(merged_df['current_op_status'])
 
-# Function to determine the color based on current_op_status
-def get_color(status):
-    if status >= 100:
-        return 'green'
-    elif status <= 0:
-        return 'red'
-    else:
-        return 'orange'
+    # Sort devices by current_op_status (lower scores first)
+    sorted_df = merged_df.sort_values('current_op_status', kind='stable')
+    device_data = merged_df.to_dict(orient='records')
+    return {
+        'device_data': device_data,
+        'device_index': DeviceIndex(device_data, id_key='device_id', name_key='device_name', mac_key=None),
+        'sorted_devices': sorted_df.to_dict(orient='records'),
+    }
+
+# Load data from CSV files, reloading them in the background whenever they change
+loader = SnapshotLoader(
+    {'synthetic_current_op_status.csv': pd.read_csv, 'synthetic_basic_info.csv': pd.read_csv},
+    lambda frames: build_snapshot(frames['synthetic_current_op_status.csv'], frames['synthetic_basic_info.csv']),
+).start()
 
 @app.route('/')
 def index():
-    # Sort devices by current_op_status (lower scores first)
-    sorted_devices = sorted(device_data, key=lambda d: d['current_op_status'])
-    return render_template('index.html', devices=sorted_devices)
+    return render_template('index.html', devices=loader.snapshot['sorted_devices'])
 
 @app.route('/device/<device_id>')
 def device_info(device_id):
-    device = next((device for device in device_data if device['device_id'] == device_id), None)
+    device = loader.snapshot['device_index'].get(device_id)
     if device:
         return jsonify(device)
     else:
@@ -1,8 +1,18 @@
-from flask import Flask, jsonify, render_template
+import json
+import os
+import sys
+from flask import Flask, Response, jsonify, render_template, request
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dashboard_data import cached_response, page_args, query_records
+from status_classification import classify, status_counts, STATUS_COLORS, STATUS_LABELS
+
 app = Flask(__name__)
 
+# Server-sent events stream of device state changes published by async_pulling.py
+DEVICE_EVENTS_URL = os.environ.get('DEVICE_EVENTS_URL', 'http://localhost:8081/events')
+
 # Sample data for demonstration: replace these with your actual data sources
 # Sample data for New York and Boston devices
 ny_basic_info = pd.DataFrame({
@@ -31,13 +41,10 @@ site_dfs = {
     'Boston': (boston_basic_info, boston_op_status)
 }
 
-def calculate_site_info(basic_info, op_status):
-    merged_data = pd.merge(basic_info, op_status, on=['name', 'id', 'macAddress'])
-    total_devices = len(merged_data)
-    healthy_devices = merged_data[merged_data['connectivityStatus'] == 100].shape[0]
-    critical_devices = merged_data[merged_data['connectivityStatus'] == 0].shape[0]
-    warning_devices = total_devices - healthy_devices - critical_devices
-    
+def calculate_site_info(status_codes):
+    total_devices = len(status_codes)
+    critical_devices, warning_devices, healthy_devices = status_counts(status_codes)
+
     return {
         'totalDevices': total_devices,
         'healthyDevices': healthy_devices,
@@ -45,12 +52,29 @@ def calculate_site_info(basic_info, op_status):
         'criticalDevices': critical_devices
     }
 
-# Calculate site info for each site and aggregate for the overview
-site_data = []
-for site_name, (basic_info, op_status) in site_dfs.items():
-    site_info = calculate_site_info(basic_info, op_status)
-    site_info['siteName'] = site_name
-    site_data.append(site_info)
+def build_snapshot(site_dfs):
+    """Precomputes the site overview and each site's colored device records, once per data load."""
+    site_data = []
+    site_info_by_name = {}
+    device_data = {}
+    for site_name, (basic_info, op_status) in site_dfs.items():
+        merged_data = pd.merge(basic_info, op_status, on=['name', 'id', 'macAddress'])
+        status_codes = classify(merged_data['connectivityStatus'])
+
+        # Calculate site info for each site and aggregate for the overview
+        site_info = calculate_site_info(status_codes)
+        site_info['siteName'] = site_name
+        site_data.append(site_info)
+        site_info_by_name[site_name] = site_info
+
+        # Add color coding and the status bucket used for filtering
+        merged_data['color'] = STATUS_COLORS[status_codes]
+        merged_data['status'] = STATUS_LABELS[status_codes]
+        device_data[site_name] = merged_data.to_dict(orient='records')
+
+    return {'site_data': site_data, 'site_info': site_info_by_name, 'device_data': device_data}
+
+snapshot = build_snapshot(site_dfs)
 
 @app.route('/')
 def overview():
@@ -58,19 +82,33 @@ def overview():
 
 @app.route('/site-data')
 def get_site_data():
-    return jsonify(site_data)
+    return jsonify(snapshot['site_data'])
 
 @app.route('/site/<site_name>')
 def site_details(site_name):
-    return render_template('index.html', site_name=site_name)
+    return render_template('index.html', site_name=site_name, events_url=DEVICE_EVENTS_URL)
 
 @app.route('/device-data/<site_name>')
 def get_device_data(site_name):
-    basic_info, op_status = site_dfs.get(site_name, (pd.DataFrame(), pd.DataFrame()))
-    merged_data = pd.merge(basic_info, op_status, on=['name', 'id', 'macAddress'])
-    # Add color coding for device status
-    merged_data['color'] = merged_data['connectivityStatus'].apply(lambda x: 'green' if x == 100 else 'yellow' if x == 50 else 'red')
-    return jsonify(merged_data.to_dict(orient='records'))
+    """Returns one page of a site's devices.
+
+    Query args: offset, limit, status (critical, warning, healthy; comma
+    separated), q (searches id, name, MAC address and location), sort (any
+    column) and order (asc/desc). Unchanged pages answer 304 via ETag.
+    """
+    page = query_records(
+        snapshot['device_data'].get(site_name, []),
+        search_keys=('id', 'name', 'macAddress', 'location'),
+        **page_args(request.args),
+    )
+    page['siteInfo'] = snapshot['site_info'].get(site_name)
+    status, body, headers = cached_response(
+        json.dumps(page).encode(),
+        'application/json',
+        request.headers.get('If-None-Match'),
+        request.headers.get('Accept-Encoding', ''),
+    )
+    return Response(body, status=status, headers=headers)
 
 
 if __name__ == '__main__':
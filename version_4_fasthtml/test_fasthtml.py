@@ -1,30 +1,165 @@
 from fasthtml.common import *
+import os
+import sys
 import pandas as pd
 
-# Load and merge data
-basic_info_df = pd.read_csv('basic_info.csv')
-op_status_df = pd.read_csv('op_status.csv')
-merged_df = pd.merge(basic_info_df, op_status_df, on=['name', 'id', 'macAddress'])
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dashboard_data import DeviceIndex, SnapshotLoader
+from status_classification import classify, status_counts, STATUS_COLORS
 
-app, rt = fast_app()
+def build_snapshot(basic_info_df, op_status_df):
+    """Merges the device tables into the records and lookup index the routes serve, once per data load."""
+    merged_df = pd.merge(basic_info_df, op_status_df, on=['name', 'id', 'macAddress'])
+    status_codes = classify(merged_df['connectivityStatus'])
+    merged_df['color'] = STATUS_COLORS[status_codes]
+    device_data = merged_df.to_dict(orient='records')
+    return {
+        'device_data': device_data,
+        'device_index': DeviceIndex(device_data),
+        'status_counts': status_counts(status_codes),
+    }
 
-# Mock data for the devices (replace with actual data or dynamic fetch)
-device_data = list(merged_df.T.to_dict().values())
+# Load and merge data, reloading it in the background whenever the CSVs change
+loader = SnapshotLoader(
+    {'basic_info.csv': pd.read_csv, 'op_status.csv': pd.read_csv},
+    lambda frames: build_snapshot(frames['basic_info.csv'], frames['op_status.csv']),
+).start()
 
-# Function to generate the health indicator color
-def health_indicator(status):
-    if status == 100:
-        return 'green'
-    elif 50 <= status < 100:
-        return 'yellow'
-    else:
-        return 'red'
+DEVICES_PER_PAGE = 200  # Device dots per lazily loaded partial
 
-@rt('/')
-def homepage():
+# Static parts of the page, built once instead of per request
+DASHBOARD_STYLE = Style('''
+    body {
+        font-family: Arial, sans-serif;
+        margin: 0;
+        padding: 0;
+        background-color: var(--bg-color);
+        color: var(--text-color);
+        transition: background-color 0.3s, color 0.3s;
+    }
+    h1 {
+        background-color: var(--header-bg-color);
+        color: var(--header-text-color);
+        padding: 20px;
+        margin: 0;
+        text-align: center;
+    }
+    #theme-selector {
+        margin: 20px auto;
+        text-align: right;
+        padding-right: 30px;
+    }
+    #dashboard {
+        display: flex;
+        justify-content: center;
+        align-items: center;
+        flex-wrap: wrap;
+        padding: 20px;
+        max-width: 1200px;
+        margin: 0 auto;
+    }
+    .device {
+        width: 60px;
+        height: 60px;
+        margin: 10px;
+        border-radius: 50%;
+        display: flex;
+        justify-content: center;
+        align-items: center;
+        font-weight: bold;
+        cursor: pointer;
+        transition: transform 0.2s;
+    }
+    .device.green {
+        background-color: #28a745;
+    }
+    .device.yellow {
+        background-color: #ffc107;
+        color: #000;
+    }
+    .device.red {
+        background-color: #dc3545;
+    }
+    .device:hover {
+        transform: scale(1.1);
+    }
+    #details {
+        margin-top: 30px;
+        text-align: center;
+    }
+    #details h3 {
+        margin-bottom: 20px;
+    }
+    :root {
+        --bg-color: #f5f5f5;
+        --text-color: #333;
+        --header-bg-color: #28a745;
+        --header-text-color: #fff;
+    }
+    body.dark-mode {
+        --bg-color: #333;
+        --text-color: #f5f5f5;
+        --header-bg-color: #444;
+        --header-text-color: #fff;
+    }
+    .tooltip {
+        visibility: hidden;
+        background-color: black;
+        color: #fff;
+        text-align: center;
+        border-radius: 6px;
+        padding: 5px;
+        position: absolute;
+        z-index: 1;
+        bottom: 125%;
+        left: 50%;
+        margin-left: -60px;
+        opacity: 0;
+        transition: opacity 0.3s;
+        font-size: 14px;
+        white-space: nowrap;
+    }
+    .device-dot:hover .tooltip {
+        visibility: visible;
+        opacity: 1;
+    }
+''')
+
+THEME_SCRIPT = Script('''
+    document.getElementById('theme-toggle').addEventListener('change', function() {
+        if (this.value === 'dark') {
+            document.body.classList.add('dark-mode');
+        } else {
+            document.body.classList.remove('dark-mode');
+        }
+    });
+''')
+
+app, rt = fast_app(hdrs=(DASHBOARD_STYLE,))
+
+# Rendered components for the current snapshot version, keyed by page (None for the shell)
+component_cache = {'version': None, 'components': {}}
+
+def cached_component(key, build):
+    """Returns the component for key, building it at most once per snapshot version."""
+    snapshot = loader.snapshot
+    if component_cache['version'] != snapshot['version']:
+        component_cache['version'] = snapshot['version']
+        component_cache['components'] = {}
+    components = component_cache['components']
+    if key not in components:
+        components[key] = build(snapshot)
+    return components[key]
+
+def device_page_loader(page):
+    """Placeholder that htmx swaps for the given page of devices once it scrolls into view."""
+    return Div(hx_get=f'/devices?page={page}', hx_trigger='revealed', hx_swap='outerHTML')
+
+def build_device_page(snapshot, page):
+    devices = snapshot['device_data'][page * DEVICES_PER_PAGE:(page + 1) * DEVICES_PER_PAGE]
     dashboard_items = []
-    for device in device_data:
-        color = health_indicator(device['connectivityStatus'])
+    for device in devices:
+        color = device['color']
         dashboard_items.append(
             Div(
                 A('●', href=f'/device/{device["name"]}', 
@@ -33,7 +168,12 @@ def homepage():
                 Div(f'{device["name"]}: {device["connectivityStatus"]}', cls='tooltip')
             )
         )
+    if (page + 1) * DEVICES_PER_PAGE < len(snapshot['device_data']):
+        dashboard_items.append(device_page_loader(page + 1))
+    return tuple(dashboard_items)
 
+def build_shell(snapshot):
+    critical, warning, healthy = snapshot['status_counts']
     return Div(
         H1('Device Status Dashboard'),
         Div(
@@ -45,118 +185,29 @@ def homepage():
             ),
             id='theme-selector'
         ),
-        Div(*dashboard_items, id='dashboard', style="display: flex; flex-wrap: wrap; gap: 20px;"),
+        P(f'Total: {len(snapshot["device_data"])} | Healthy: {healthy} | Warning: {warning} | Critical: {critical}',
+          id='summary'),
+        Div(device_page_loader(0), id='dashboard', style="display: flex; flex-wrap: wrap; gap: 20px;"),
         Div(id='details'),
-        Script('''
-            document.getElementById('theme-toggle').addEventListener('change', function() {
-                if (this.value === 'dark') {
-                    document.body.classList.add('dark-mode');
-                } else {
-                    document.body.classList.remove('dark-mode');
-                }
-            });
-        '''),
-        Style('''
-            body {
-                font-family: Arial, sans-serif;
-                margin: 0;
-                padding: 0;
-                background-color: var(--bg-color);
-                color: var(--text-color);
-                transition: background-color 0.3s, color 0.3s;
-            }
-            h1 {
-                background-color: var(--header-bg-color);
-                color: var(--header-text-color);
-                padding: 20px;
-                margin: 0;
-                text-align: center;
-            }
-            #theme-selector {
-                margin: 20px auto;
-                text-align: right;
-                padding-right: 30px;
-            }
-            #dashboard {
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                flex-wrap: wrap;
-                padding: 20px;
-                max-width: 1200px;
-                margin: 0 auto;
-            }
-            .device {
-                width: 60px;
-                height: 60px;
-                margin: 10px;
-                border-radius: 50%;
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                font-weight: bold;
-                cursor: pointer;
-                transition: transform 0.2s;
-            }
-            .device.green {
-                background-color: #28a745;
-            }
-            .device.yellow {
-                background-color: #ffc107;
-                color: #000;
-            }
-            .device.red {
-                background-color: #dc3545;
-            }
-            .device:hover {
-                transform: scale(1.1);
-            }
-            #details {
-                margin-top: 30px;
-                text-align: center;
-            }
-            #details h3 {
-                margin-bottom: 20px;
-            }
-            :root {
-                --bg-color: #f5f5f5;
-                --text-color: #333;
-                --header-bg-color: #28a745;
-                --header-text-color: #fff;
-            }
-            body.dark-mode {
-                --bg-color: #333;
-                --text-color: #f5f5f5;
-                --header-bg-color: #444;
-                --header-text-color: #fff;
-            }
-            .tooltip {
-                visibility: hidden;
-                background-color: black;
-                color: #fff;
-                text-align: center;
-                border-radius: 6px;
-                padding: 5px;
-                position: absolute;
-                z-index: 1;
-                bottom: 125%;
-                left: 50%;
-                margin-left: -60px;
-                opacity: 0;
-                transition: opacity 0.3s;
-                font-size: 14px;
-                white-space: nowrap;
-            }
-            .device-dot:hover .tooltip {
-                visibility: visible;
-                opacity: 1;
-            }
-        ''')
+        THEME_SCRIPT,
     )
 
+@rt('/')
+def homepage():
+    """Renders the summary shell; the device dots are loaded page by page as the user scrolls."""
+    return cached_component(None, build_shell)
+
+@rt('/devices')
+def device_page(page: int = 0):
+    """Returns one page of device dots plus the loader for the next page."""
+    # Every page past the end is the same empty page, so arbitrary ?page= values can't grow the cache
+    page_count = -(-len(loader.snapshot['device_data']) // DEVICES_PER_PAGE)
+    page = min(max(page, 0), page_count)
+    return cached_component(page, lambda snapshot: build_device_page(snapshot, page))
+
 @rt('/device/{name}')
 def device_detail(request, name: str = None):
-    device_info = next((d for d in device_data if d['name'] == name), None)
+    device_info = loader.snapshot['device_index'].get(name)
     
     if device_info is None:
         return Div(H2(f'Device "{name}" not found'), A('Back to Home', href='/'))